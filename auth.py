@@ -1,21 +1,27 @@
 """Authentication module with email/password support."""
 
 from fastapi import Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
-from models import User, UserRole
-from database import SessionLocal
+from sqlalchemy.orm import Session, selectinload
+from models import User, UserRole, UserHouseholdAssociation
+from database import ScopedSession
 from passlib.context import CryptContext
 from itsdangerous import URLSafeTimedSerializer
 import os
 import secrets
+import hashlib
 import datetime
 from dotenv import load_dotenv
 from typing import Optional
 
 load_dotenv()
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing: bcrypt over a SHA-256 digest of the password, so long inputs
+# are neither truncated at 72 bytes nor more expensive to hash. Plain bcrypt
+# hashes from before the switch still verify and are upgraded on next login.
+pwd_context = CryptContext(schemes=["bcrypt_sha256", "bcrypt"], deprecated="auto")
+
+# Upper bound on accepted password size, checked before any hashing
+MAX_PASSWORD_BYTES = 1024
 
 # Secret key for tokens
 SECRET_KEY = os.getenv('SESSION_SECRET', os.getenv('SECRET_KEY', 'default-secret-key'))
@@ -28,15 +34,19 @@ BASE_URL = os.getenv('BASE_URL', 'http://localhost:8000')
 
 
 def get_db():
-    db = SessionLocal()
     try:
-        yield db
+        yield ScopedSession()
     finally:
-        db.close()
+        ScopedSession.remove()
+
+
+def password_too_long(password: str) -> bool:
+    """Check whether a password exceeds MAX_PASSWORD_BYTES."""
+    return len(password.encode('utf-8')) > MAX_PASSWORD_BYTES
 
 
 def hash_password(password: str) -> str:
-    """Hash a password using bcrypt."""
+    """Hash a password using pre-hashed bcrypt."""
     return pwd_context.hash(password)
 
 
@@ -50,13 +60,32 @@ def generate_verification_token() -> str:
     return secrets.token_urlsafe(32)
 
 
+def normalize_email(email: str) -> str:
+    """Normalize an email address to the stored form (trimmed, lowercased)."""
+    return email.strip().lower()
+
+
+def hash_token(token: str) -> str:
+    """Hash an emailed token; only the hash is stored, and lookups compare hashes."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
 def get_current_user(request: Request, db: Session = Depends(get_db)) -> Optional[User]:
-    """Get the current user from the session."""
+    """Get the current user from the session, cached on the request after the first lookup."""
+    if hasattr(request.state, 'user'):
+        return request.state.user
+    
     user_email = request.session.get('user_email')
-    if not user_email:
-        return None
+    user = None
+    if user_email:
+        user = db.query(User).options(
+            selectinload(User.households),
+            selectinload(User.household_associations).joinedload(UserHouseholdAssociation.household)
+        ).filter(User.email == normalize_email(user_email)).first()
     
-    return db.query(User).filter(User.email == user_email).first()
+    request.state.user = user
+    request.state.is_admin = user is not None and is_admin(user)
+    return user
 
 
 def require_user(request: Request, db: Session = Depends(get_db)) -> User:
@@ -84,7 +113,7 @@ def require_verified_user(request: Request, db: Session = Depends(get_db)) -> Us
 def require_admin(request: Request, db: Session = Depends(get_db)) -> User:
     """Require an admin user or raise an exception."""
     user = require_user(request, db)
-    if not is_admin(user):
+    if not request.state.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin privileges required"
@@ -102,17 +131,16 @@ def create_user(
     email: str,
     password: str,
     name: str,
+    verification_token: str,
     is_first_user: bool = False
 ) -> User:
-    """Create a new user with hashed password and verification token."""
-    verification_token = generate_verification_token()
-    
+    """Create a new user with hashed password and hashed verification token."""
     user = User(
         name=name,
-        email=email,
+        email=normalize_email(email),
         password_hash=hash_password(password),
         is_email_verified=False,
-        email_verification_token=verification_token,
+        email_verification_token=hash_token(verification_token),
         email_verification_expires=datetime.datetime.utcnow() + datetime.timedelta(hours=24),
         role=UserRole.ADMIN if is_first_user else UserRole.MEMBER
     )
@@ -126,13 +154,17 @@ def create_user(
 
 def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     """Authenticate a user by email and password."""
-    user = db.query(User).filter(User.email == email).first()
+    user = db.query(User).filter(User.email == normalize_email(email)).first()
     if not user:
         return None
-    if not user.password_hash:
+    if not user.password_hash or password_too_long(password):
         return None
-    if not verify_password(password, user.password_hash):
+    valid, new_hash = pwd_context.verify_and_update(password, user.password_hash)
+    if not valid:
         return None
+    if new_hash:
+        user.password_hash = new_hash
+        db.commit()
     return user
 
 
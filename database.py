@@ -1,13 +1,105 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import contextvars
+import logging
+import threading
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.schema import CreateIndex
 from models import Base
 
+logger = logging.getLogger(__name__)
+
 # Allow database path to be configured via environment variable
 # This is useful for Railway persistent volumes
 DATABASE_PATH = os.getenv('DATABASE_PATH', 'food_log.db')
 DATABASE_URL = f'sqlite:///{DATABASE_PATH}'
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Size the pool for dashboard bursts and fail fast instead of queueing for 30s.
+# Sync handlers run on anyio's 40-thread pool; 25 + 25 covers every worker
+# holding a session at once.
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=25,
+    max_overflow=25,
+    pool_timeout=5,
+    pool_recycle=1800,
+    pool_pre_ping=True
+)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base.metadata.create_all(bind=engine)
+
+
+def _colliding_user_ids(conn):
+    """Groups of user ids whose emails differ only in case or surrounding space."""
+    rows = conn.execute(text(
+        "SELECT group_concat(id) FROM users "
+        "GROUP BY lower(trim(email)) HAVING count(*) > 1"
+    ))
+    return [sorted(int(user_id) for user_id in ids.split(',')) for (ids,) in rows]
+
+
+# Emails are stored lowercased; fold rows written before that, leaving any address
+# that would collide with another account as it is
+with engine.begin() as conn:
+    email_collisions = _colliding_user_ids(conn)
+    if email_collisions:
+        # normalize_email lookups can't match these mixed-case rows, so the accounts
+        # can't log in until an operator merges or renames them
+        logger.warning(
+            "Not folding emails for users that collide case-insensitively; merge them: %s",
+            email_collisions
+        )
+    conn.execute(text(
+        "UPDATE users SET email = lower(trim(email)) "
+        "WHERE email != lower(trim(email)) "
+        "AND NOT EXISTS (SELECT 1 FROM users AS u WHERE lower(trim(u.email)) = lower(trim(users.email)) AND u.id != users.id)"
+    ))
+    # Pending invitations to one household that differ only in case would collide
+    # once folded (ux_pending_invitation); keep the newest and reject the rest
+    conn.execute(text(
+        "UPDATE household_invitations SET status = 'REJECTED' "
+        "WHERE status = 'PENDING' "
+        "AND EXISTS (SELECT 1 FROM household_invitations AS i WHERE i.status = 'PENDING' "
+        "AND i.household_id = household_invitations.household_id "
+        "AND lower(trim(i.email)) = lower(trim(household_invitations.email)) "
+        "AND i.id > household_invitations.id)"
+    ))
+    conn.execute(text(
+        "UPDATE household_invitations SET email = lower(trim(email)) WHERE email != lower(trim(email))"
+    ))
+
+# create_all skips tables that already exist, so add any indexes they are missing.
+# IF NOT EXISTS rather than checkfirst: SQLite reflection doesn't report expression indexes.
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        try:
+            with engine.begin() as conn:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+        except IntegrityError:
+            # Existing rows violate a unique index (e.g. emails differing only in case)
+            if table.name == 'users':
+                logger.warning(
+                    "Skipping index %s: users %s have emails differing only in case",
+                    index.name, email_collisions
+                )
+            else:
+                logger.warning("Skipping index %s: existing data violates its uniqueness", index.name)
+
+# One session per request. Sync dependencies run on threadpool workers, so the
+# scope is keyed on a per-request context variable rather than the thread.
+_request_scope = contextvars.ContextVar('request_scope', default=None)
+
+
+def _current_scope():
+    scope = _request_scope.get()
+    return scope if scope is not None else threading.get_ident()
+
+
+def begin_request_scope():
+    """Start a new session scope for the current request context."""
+    _request_scope.set(object())
+
+
+ScopedSession = scoped_session(SessionLocal, scopefunc=_current_scope)
@@ -1,7 +1,10 @@
 """Email service using Resend for sending verification and invitation emails."""
 
 import os
+import httpx
 import resend
+from concurrent.futures import ThreadPoolExecutor
+from resend.http_client import HTTPClient
 from typing import Optional
 
 # Initialize Resend
@@ -11,6 +14,50 @@ resend.api_key = os.getenv('RESEND_API_KEY')
 SENDER_EMAIL = os.getenv('SENDER_EMAIL', 'noreply@yourdomain.com')
 APP_NAME = "Philosophers Fridge"
 
+# Emails go out on their own small pool, so slow Resend calls never hold the
+# threads that serve requests and email throughput can be sized on its own
+EMAIL_WORKERS = int(os.getenv('EMAIL_WORKERS', '4'))
+_email_executor = ThreadPoolExecutor(max_workers=EMAIL_WORKERS, thread_name_prefix='email')
+
+
+class KeepAliveHTTPClient(HTTPClient):
+    """Resend HTTP client that reuses pooled connections across sends.
+    
+    The SDK's default client calls requests.request(), which opens a new
+    TCP/TLS connection for every email.
+    """
+    
+    def __init__(self, timeout: int = 30):
+        # One shared httpx client (the same stack the AI SDKs use), with a
+        # kept-alive connection per email worker
+        self._client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=EMAIL_WORKERS, max_keepalive_connections=EMAIL_WORKERS)
+        )
+    
+    def request(self, method, url, headers, json=None, files=None, data=None):
+        try:
+            resp = self._client.request(
+                method=method,
+                url=url,
+                headers=headers,
+                json=json if files is None and data is None else None,
+                files=files,
+                data=data,
+            )
+            return resp.content, resp.status_code, resp.headers
+        except httpx.HTTPError as e:
+            # Resend wraps this in a ResendError, as with its default client
+            raise RuntimeError(f"Request failed: {e}") from e
+
+
+resend.default_http_client = KeepAliveHTTPClient()
+
+
+def queue_email(send, *args, **kwargs) -> None:
+    """Hand an email to the email worker pool and return without waiting for it."""
+    _email_executor.submit(send, *args, **kwargs)
+
 
 def send_verification_email(to_email: str, name: str, verification_link: str) -> bool:
     """Send email verification link to new user."""
@@ -1,38 +1,73 @@
 from fastapi import FastAPI, Request, Form, Depends, HTTPException, status, Query
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from sqlalchemy import case, exists, func, insert, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload
 from models import User, FoodLog, Household, UserRole, HouseholdInvitation, InvitationStatus, UserHouseholdAssociation
-from database import SessionLocal
+from database import begin_request_scope
 import config
-from openai import OpenAI
-import anthropic
+import logging
 import os
 import datetime
+import json
+import re
+from collections import OrderedDict
+from functools import lru_cache
 import secrets
+import asyncio
+import time
+from urllib.parse import urlencode
 from dotenv import load_dotenv
 from starlette.middleware.sessions import SessionMiddleware
+from starlette.concurrency import run_in_threadpool
+from slowapi import _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
 from auth import (
-    get_current_user, require_user, require_admin, is_admin,
-    hash_password, verify_password, authenticate_user, create_user,
-    generate_verification_token, get_verification_link, get_password_reset_link,
+    get_db, get_current_user, require_user, require_admin, is_admin,
+    hash_password, verify_password, password_too_long, authenticate_user, create_user,
+    generate_verification_token, hash_token, normalize_email, get_verification_link, get_password_reset_link,
     get_invitation_link, BASE_URL
 )
 from email_service import (
-    send_verification_email, send_password_reset_email, send_household_invitation_email
+    send_verification_email, send_password_reset_email, send_household_invitation_email, queue_email
 )
+from rate_limit import limiter, email_has_attempts_left, email_within_limit
 
 load_dotenv()
 
-# AI client initialization
-openai_api_key = os.getenv('OPENAI_API_KEY')
-client = OpenAI(api_key=openai_api_key) if openai_api_key else None
+logger = logging.getLogger(__name__)
 
-anthropic_api_key = os.getenv('ANTHROPIC_API_KEY')
-anthropic_client = anthropic.Client(api_key=anthropic_api_key) if anthropic_api_key else None
+# AI clients are created on first use so workers that never call them skip the SDK imports.
+# They are the async variants, so a nutrition lookup doesn't block the event loop.
+_openai_client = None
+_anthropic_client = None
 
-app = FastAPI()
+def _get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        openai_api_key = os.getenv('OPENAI_API_KEY')
+        if not openai_api_key:
+            return None
+        from openai import AsyncOpenAI
+        _openai_client = AsyncOpenAI(api_key=openai_api_key)
+    return _openai_client
+
+def _get_anthropic_client():
+    global _anthropic_client
+    if _anthropic_client is None:
+        anthropic_api_key = os.getenv('ANTHROPIC_API_KEY')
+        if not anthropic_api_key:
+            return None
+        import anthropic
+        _anthropic_client = anthropic.AsyncAnthropic(api_key=anthropic_api_key)
+    return _anthropic_client
+
+app = FastAPI(default_response_class=ORJSONResponse)
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 app.add_middleware(SessionMiddleware, secret_key=os.getenv('SESSION_SECRET', os.getenv('SECRET_KEY', 'default-secret-key')))
 
 # Redirect all HTTP requests to HTTPS in production, except for health checks
@@ -45,18 +80,82 @@ async def https_redirect_middleware(request: Request, call_next):
     
     return await call_next(request)
 
+# Give each request its own database session scope, shared by all dependencies
+@app.middleware("http")
+async def db_session_scope_middleware(request: Request, call_next):
+    begin_request_scope()
+    return await call_next(request)
+
 templates = Jinja2Templates(directory="templates")
 templates.env.globals["is_admin"] = is_admin
 
+@lru_cache(maxsize=256)
+def _render_auth_page(template_name: str, context: tuple) -> str:
+    return templates.get_template(template_name).render(dict(context))
+
+def render_auth_page(template_name: str, cache: bool = True, status_code: int = 200, **context) -> HTMLResponse:
+    """Render an auth form page whose output depends only on its context values.
+    
+    Error branches repeat the same few messages, so the rendered HTML is reused.
+    Only a fixed error string is cached: pages carrying a reset token or invite
+    code, or an error built from request data (cache=False), render uncached so
+    those values aren't kept in memory.
+    """
+    if cache and all(value is None for key, value in context.items() if key != 'error'):
+        return HTMLResponse(_render_auth_page(template_name, tuple(sorted(context.items()))), status_code=status_code)
+    return HTMLResponse(templates.get_template(template_name).render(context), status_code=status_code)
+
 # Mount static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def user_in_household(user: User, household_id: int) -> bool:
+    """Check membership by id against the user's eager-loaded households, without loading the household."""
+    return any(h.id == household_id for h in user.households)
+
+def invitation_not_expired():
+    """SQL criterion for invitations with no expiry or one still in the future."""
+    return or_(
+        HouseholdInvitation.expires_at.is_(None),
+        HouseholdInvitation.expires_at >= datetime.datetime.utcnow()
+    )
+
+def user_household_ids_subquery(user_id: int):
+    """Select the ids of a user's households, for filtering with IN (...) in SQL."""
+    return select(UserHouseholdAssociation.household_id).where(UserHouseholdAssociation.user_id == user_id)
+
+def load_dashboard_context(request: Request, db: Session, user: User) -> dict:
+    """Load the households, pending invitations and primary household shown on the dashboard."""
+    if hasattr(request.state, 'dashboard_ctx'):
+        return request.state.dashboard_ctx
+    
+    # Admins see all households, members see only their own
+    if is_admin(user):
+        households = db.query(Household).all()
+    else:
+        households = user.households
+    
+    # The dashboard lists the user's households with their member counts; load
+    # every member list in one query instead of one lazy load per household
+    if user.households:
+        db.query(Household).options(selectinload(Household.members))\
+            .filter(Household.id.in_([h.id for h in user.households]))\
+            .all()
+    
+    pending_invitations = []
+    if user.email:
+        pending_invitations = db.query(HouseholdInvitation).options(
+            selectinload(HouseholdInvitation.household)
+        ).filter(
+            HouseholdInvitation.email == user.email,
+            HouseholdInvitation.status == InvitationStatus.PENDING
+        ).all()
+    
+    request.state.dashboard_ctx = {
+        "households": households,
+        "pending_invitations": pending_invitations,
+        "primary_household": user.get_primary_household()
+    }
+    return request.state.dashboard_ctx
 
 @app.get('/health')
 async def health_check():
@@ -75,27 +174,41 @@ async def login_page(request: Request, error: str = None, message: str = None):
         "message": message
     })
 
+LOGIN_FAILURES_PER_EMAIL = "10/minute"
+
+def too_many_login_attempts() -> HTMLResponse:
+    return render_auth_page(
+        "login.html",
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        error="Too many login attempts. Please try again later."
+    )
+
 @app.post('/login')
-async def login(
+@limiter.limit("10/minute")
+def login(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
     db: Session = Depends(get_db)
 ):
     """Handle login form submission."""
+    # Only failed attempts count against an address, so its owner can still sign
+    # in after someone else's bad guesses once the window passes
+    if not email_has_attempts_left('login', email, LOGIN_FAILURES_PER_EMAIL):
+        return too_many_login_attempts()
+    
     user = authenticate_user(db, email, password)
     
     if not user:
-        return templates.TemplateResponse("login.html", {
-            "request": request,
-            "error": "Invalid email or password"
-        })
+        if not email_within_limit('login', email, LOGIN_FAILURES_PER_EMAIL):
+            return too_many_login_attempts()
+        return render_auth_page("login.html", error="Invalid email or password")
     
     if not user.is_email_verified:
-        return templates.TemplateResponse("login.html", {
-            "request": request,
-            "error": "Please verify your email before logging in. Check your inbox for the verification link."
-        })
+        return render_auth_page(
+            "login.html",
+            error="Please verify your email before logging in. Check your inbox for the verification link."
+        )
     
     # Store user email in session
     request.session['user_email'] = user.email
@@ -112,7 +225,7 @@ async def register_page(request: Request, error: str = None, invite_code: str =
     })
 
 @app.post('/register')
-async def register(
+def register(
     request: Request,
     name: str = Form(...),
     email: str = Form(...),
@@ -122,40 +235,45 @@ async def register(
     db: Session = Depends(get_db)
 ):
     """Handle registration form submission."""
+    email = normalize_email(email)
+    
     # Validate password match
     if password != confirm_password:
-        return templates.TemplateResponse("register.html", {
-            "request": request,
-            "error": "Passwords do not match",
-            "invite_code": invite_code
-        })
+        return render_auth_page("register.html", error="Passwords do not match", invite_code=invite_code)
     
     # Validate password strength
     if len(password) < 8:
-        return templates.TemplateResponse("register.html", {
-            "request": request,
-            "error": "Password must be at least 8 characters",
-            "invite_code": invite_code
-        })
+        return render_auth_page(
+            "register.html",
+            error="Password must be at least 8 characters",
+            invite_code=invite_code
+        )
+    if password_too_long(password):
+        return render_auth_page(
+            "register.html",
+            error="Password must be at most 1024 bytes",
+            invite_code=invite_code
+        )
     
     # Check if user already exists
     existing_user = db.query(User).filter(User.email == email).first()
     if existing_user:
-        return templates.TemplateResponse("register.html", {
-            "request": request,
-            "error": "An account with this email already exists",
-            "invite_code": invite_code
-        })
+        return render_auth_page(
+            "register.html",
+            error="An account with this email already exists",
+            invite_code=invite_code
+        )
     
     # Check if this is the first user (make them admin)
     is_first_user = db.query(User).count() == 0
     
     # Create user
-    user = create_user(db, email, password, name, is_first_user)
+    verification_token = generate_verification_token()
+    user = create_user(db, email, password, name, verification_token, is_first_user)
     
-    # Send verification email
-    verification_link = get_verification_link(user.email_verification_token)
-    send_verification_email(user.email, user.name, verification_link)
+    # Send verification email on the email pool
+    verification_link = get_verification_link(verification_token)
+    queue_email(send_verification_email, user.email, user.name, verification_link)
     
     # If there's an invite code, store it in session for after verification
     if invite_code:
@@ -167,21 +285,13 @@ async def register(
     })
 
 @app.get('/verify-email/{token}')
-async def verify_email(request: Request, token: str, db: Session = Depends(get_db)):
+def verify_email(request: Request, token: str, db: Session = Depends(get_db)):
     """Verify user's email address."""
-    user = db.query(User).filter(User.email_verification_token == token).first()
+    user = db.query(User).filter(User.email_verification_token == hash_token(token)).first()
     
-    if not user:
-        return templates.TemplateResponse("login.html", {
-            "request": request,
-            "error": "Invalid verification link"
-        })
-    
-    if user.email_verification_expires < datetime.datetime.utcnow():
-        return templates.TemplateResponse("login.html", {
-            "request": request,
-            "error": "Verification link has expired. Please register again."
-        })
+    # One message for both cases so responses don't reveal whether a token exists
+    if not user or user.email_verification_expires < datetime.datetime.utcnow():
+        return render_auth_page("login.html", error="Invalid or expired verification link")
     
     # Mark email as verified
     user.is_email_verified = True
@@ -204,26 +314,44 @@ async def forgot_password_page(request: Request):
     """Show forgot password page."""
     return templates.TemplateResponse("forgot_password.html", {"request": request})
 
+# Minimum response time for /forgot-password, so timing doesn't reveal whether an account exists
+FORGOT_PASSWORD_RESPONSE_SECONDS = 0.5
+
+def issue_password_reset(db: Session, email: str) -> None:
+    """Store a reset token for the account with this email, if any, and queue the email."""
+    user = db.query(User).filter(User.email == normalize_email(email)).first()
+    if not user:
+        return
+    
+    # Read these before commit expires the instance and forces a reload
+    user_email, user_name = user.email, user.name
+    
+    # Generate reset token
+    token = secrets.token_urlsafe(32)
+    user.password_reset_token = hash_token(token)
+    user.password_reset_expires = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    db.commit()
+    
+    # Send reset email on the email pool
+    reset_link = get_password_reset_link(token)
+    queue_email(send_password_reset_email, user_email, user_name, reset_link)
+
 @app.post('/forgot-password')
+@limiter.limit("5/minute")
 async def forgot_password(
     request: Request,
     email: str = Form(...),
     db: Session = Depends(get_db)
 ):
     """Handle forgot password form submission."""
-    user = db.query(User).filter(User.email == email).first()
+    started = time.monotonic()
     
     # Always show success message (don't reveal if email exists)
-    if user:
-        # Generate reset token
-        token = secrets.token_urlsafe(32)
-        user.password_reset_token = token
-        user.password_reset_expires = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
-        db.commit()
-        
-        # Send reset email
-        reset_link = get_password_reset_link(token)
-        send_password_reset_email(user.email, user.name, reset_link)
+    if email_within_limit('forgot-password', email, "5/minute"):
+        await run_in_threadpool(issue_password_reset, db, email)
+    
+    # Pad to a fixed response time so the extra UPDATE for real accounts can't be measured
+    await asyncio.sleep(max(0.0, FORGOT_PASSWORD_RESPONSE_SECONDS - (time.monotonic() - started)))
     
     return templates.TemplateResponse("forgot_password.html", {
         "request": request,
@@ -231,15 +359,12 @@ async def forgot_password(
     })
 
 @app.get('/reset-password/{token}', response_class=HTMLResponse)
-async def reset_password_page(request: Request, token: str, db: Session = Depends(get_db)):
+def reset_password_page(request: Request, token: str, db: Session = Depends(get_db)):
     """Show reset password page."""
-    user = db.query(User).filter(User.password_reset_token == token).first()
+    user = db.query(User).filter(User.password_reset_token == hash_token(token)).first()
     
     if not user or user.password_reset_expires < datetime.datetime.utcnow():
-        return templates.TemplateResponse("login.html", {
-            "request": request,
-            "error": "Invalid or expired reset link"
-        })
+        return render_auth_page("login.html", error="Invalid or expired reset link")
     
     return templates.TemplateResponse("reset_password.html", {
         "request": request,
@@ -247,7 +372,7 @@ async def reset_password_page(request: Request, token: str, db: Session = Depend
     })
 
 @app.post('/reset-password/{token}')
-async def reset_password(
+def reset_password(
     request: Request,
     token: str,
     password: str = Form(...),
@@ -255,27 +380,26 @@ async def reset_password(
     db: Session = Depends(get_db)
 ):
     """Handle password reset form submission."""
-    user = db.query(User).filter(User.password_reset_token == token).first()
+    user = db.query(User).filter(User.password_reset_token == hash_token(token)).first()
     
     if not user or user.password_reset_expires < datetime.datetime.utcnow():
-        return templates.TemplateResponse("login.html", {
-            "request": request,
-            "error": "Invalid or expired reset link"
-        })
+        return render_auth_page("login.html", error="Invalid or expired reset link")
     
     if password != confirm_password:
-        return templates.TemplateResponse("reset_password.html", {
-            "request": request,
-            "token": token,
-            "error": "Passwords do not match"
-        })
+        return render_auth_page("reset_password.html", token=token, error="Passwords do not match")
     
     if len(password) < 8:
-        return templates.TemplateResponse("reset_password.html", {
-            "request": request,
-            "token": token,
-            "error": "Password must be at least 8 characters"
-        })
+        return render_auth_page(
+            "reset_password.html",
+            token=token,
+            error="Password must be at least 8 characters"
+        )
+    if password_too_long(password):
+        return render_auth_page(
+            "reset_password.html",
+            token=token,
+            error="Password must be at most 1024 bytes"
+        )
     
     # Update password
     user.password_hash = hash_password(password)
@@ -295,53 +419,62 @@ async def logout(request: Request):
     return RedirectResponse(url='/login')
 
 @app.get('/accept-invite/{invite_code}')
-async def accept_invite(
+def accept_invite(
     request: Request,
     invite_code: str,
     db: Session = Depends(get_db)
 ):
     """Handle invitation link clicks. Redirects to register or processes acceptance."""
-    # Find the invitation
-    invitation = db.query(HouseholdInvitation).filter(
-        HouseholdInvitation.invite_code == invite_code,
-        HouseholdInvitation.status == InvitationStatus.PENDING
-    ).first()
-    
-    if not invitation:
-        return templates.TemplateResponse("login.html", {
-            "request": request,
-            "error": "Invalid or expired invitation link"
-        })
-    
-    # Check if invitation has expired
-    if invitation.expires_at and invitation.expires_at < datetime.datetime.utcnow():
-        return templates.TemplateResponse("login.html", {
-            "request": request,
-            "error": "This invitation has expired"
-        })
-    
     # Check if user is logged in
     user = get_current_user(request, db)
     
     if user:
-        # User is logged in - check if their email matches
-        if user.email.lower() == invitation.email.lower():
-            # Accept the invitation
-            assoc = UserHouseholdAssociation(
-                user_id=user.id,
-                household_id=invitation.household_id,
-                is_primary=len(user.households) == 0
+        # Claim the invitation in a single UPDATE so concurrent clicks can't both accept it
+        household_id = db.execute(
+            update(HouseholdInvitation)
+            .where(
+                HouseholdInvitation.invite_code == invite_code,
+                HouseholdInvitation.status == InvitationStatus.PENDING,
+                invitation_not_expired(),
+                HouseholdInvitation.email == user.email
+            )
+            .values(status=InvitationStatus.ACCEPTED)
+            .returning(HouseholdInvitation.household_id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        
+        if household_id is not None:
+            # A repeated submit finds the membership already there and does nothing
+            db.execute(
+                sqlite_insert(UserHouseholdAssociation)
+                .values(
+                    user_id=user.id,
+                    household_id=household_id,
+                    is_primary=not user.households
+                )
+                .on_conflict_do_nothing()
             )
-            db.add(assoc)
-            invitation.status = InvitationStatus.ACCEPTED
             db.commit()
             
             return RedirectResponse(url='/?message=You have joined the household!', status_code=303)
-        else:
-            return templates.TemplateResponse("login.html", {
-                "request": request,
-                "error": f"This invitation was sent to {invitation.email}. Please logout and login with that email."
-            })
+    
+    # Find the invitation; expired ones are filtered out in the query
+    invitation = db.query(HouseholdInvitation).filter(
+        HouseholdInvitation.invite_code == invite_code,
+        HouseholdInvitation.status == InvitationStatus.PENDING,
+        invitation_not_expired()
+    ).first()
+    
+    if not invitation:
+        return render_auth_page("login.html", error="Invalid or expired invitation link")
+    
+    # A logged-in user who couldn't claim a valid invitation has the wrong email
+    if user:
+        return render_auth_page(
+            "login.html",
+            cache=False,
+            error=f"This invitation was sent to {invitation.email}. Please logout and login with that email."
+        )
     
     # Check if user with this email already exists
     existing_user = db.query(User).filter(User.email == invitation.email).first()
@@ -354,12 +487,25 @@ async def accept_invite(
         # Redirect to registration with invite code
         return RedirectResponse(url=f'/register?invite_code={invite_code}', status_code=303)
 
+# The dashboard defaults to the 7 days ending today
+DEFAULT_RANGE_OFFSET = datetime.timedelta(days=6)
+
+def parse_date_param(value: str, default: datetime.date) -> datetime.date:
+    """Parse a YYYY-MM-DD query parameter, falling back to default if missing or malformed."""
+    if not value:
+        return default
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        return default
+
 @app.get('/', response_class=HTMLResponse)
-async def read_form(
+def read_form(
     request: Request, 
     db: Session = Depends(get_db),
     start_date: str = Query(None),
-    end_date: str = Query(None)
+    end_date: str = Query(None),
+    message: str = Query(None)
 ):
     user = get_current_user(request, db)
     
@@ -368,40 +514,13 @@ async def read_form(
             "request": request,
         })
     
-    # Get households (admins see all, members see only their own)
-    if is_admin(user):
-        households = db.query(Household).all()
-    else:
-        households = user.households
-    
-    # Get pending invitations for this user
-    pending_invitations = []
-    if user.email:
-        pending_invitations = db.query(HouseholdInvitation).join(Household).filter(
-            HouseholdInvitation.email == user.email,
-            HouseholdInvitation.status == InvitationStatus.PENDING
-        ).all()
-    
-    # Get the user's primary household
-    primary_household = user.get_primary_household()
+    dashboard_ctx = load_dashboard_context(request, db, user)
+    household_ids = tuple(h.id for h in user.households)
     
     # Set up date range (default to last 7 days)
-    today = datetime.datetime.now().date()
-    if end_date:
-        try:
-            end_dt = datetime.datetime.strptime(end_date, "%Y-%m-%d").date()
-        except ValueError:
-            end_dt = today
-    else:
-        end_dt = today
-    
-    if start_date:
-        try:
-            start_dt = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
-        except ValueError:
-            start_dt = today - datetime.timedelta(days=6)
-    else:
-        start_dt = today - datetime.timedelta(days=6)
+    today = datetime.date.today()
+    end_dt = parse_date_param(end_date, today)
+    start_dt = parse_date_param(start_date, today - DEFAULT_RANGE_OFFSET)
     
     # Convert to datetime for comparison (start of start_date to end of end_date)
     start_datetime = datetime.datetime.combine(start_dt, datetime.time.min)
@@ -415,34 +534,11 @@ async def read_form(
     total_fat = 0
     total_sugar = 0
     nutrition_per_person = []
+    recent_logs = []
     
-    if user.households:
-        household_ids = [h.id for h in user.households]
-        
-        # Get total nutrition
-        from sqlalchemy import func
-        totals = db.query(
-            func.sum(FoodLog.calorie_count).label('calories'),
-            func.sum(FoodLog.protein).label('protein'),
-            func.sum(FoodLog.carbohydrates).label('carbs'),
-            func.sum(FoodLog.fiber).label('fiber'),
-            func.sum(FoodLog.fat).label('fat'),
-            func.sum(FoodLog.sugar).label('sugar')
-        )\
-            .filter(FoodLog.household_id.in_(household_ids))\
-            .filter(FoodLog.timestamp >= start_datetime)\
-            .filter(FoodLog.timestamp <= end_datetime)\
-            .first()
-        
-        if totals:
-            total_calories = totals.calories or 0
-            total_protein = totals.protein or 0
-            total_carbs = totals.carbs or 0
-            total_fiber = totals.fiber or 0
-            total_fat = totals.fat or 0
-            total_sugar = totals.sugar or 0
-        
-        # Get nutrition per person
+    if household_ids:
+        # Get nutrition per person; household totals are summed from these rows
+        # so the logs in the date range are only scanned once
         per_person = db.query(
             User.id,
             User.name,
@@ -475,42 +571,41 @@ async def read_form(
                 'total_sugar': round(person.total_sugar or 0, 1),
                 'log_count': person.log_count
             })
-    
-    # Get recent food logs (top 5) for user's households
-    recent_logs = []
-    if user.households:
-        household_ids = [h.id for h in user.households]
-        logs = db.query(FoodLog, User, Household)\
-            .select_from(FoodLog)\
-            .join(User, FoodLog.user_id == User.id)\
-            .join(Household, FoodLog.household_id == Household.id)\
-            .filter(FoodLog.household_id.in_(household_ids))\
-            .order_by(FoodLog.timestamp.desc())\
-            .limit(5)\
-            .all()
+            total_calories += person.total_calories or 0
+            total_protein += person.total_protein or 0
+            total_carbs += person.total_carbs or 0
+            total_fiber += person.total_fiber or 0
+            total_fat += person.total_fat or 0
+            total_sugar += person.total_sugar or 0
         
-        for log, log_user, household in logs:
-            recent_logs.append({
-                'id': log.id,
-                'household_name': household.name,
-                'user_name': log_user.name,
-                'food_name': log.food_name,
-                'portion_size': log.portion_size,
-                'calorie_count': log.calorie_count,
-                'protein': log.protein,
-                'carbohydrates': log.carbohydrates,
-                'fiber': log.fiber,
-                'fat': log.fat,
-                'sugar': log.sugar,
-                'timestamp': log.timestamp.strftime("%b %d, %Y %I:%M %p")
-            })
+        # Get recent food logs (top 5) for user's households as plain rows;
+        # the template formats the timestamp
+        recent_logs = db.execute(
+            select(
+                FoodLog.id,
+                Household.name.label('household_name'),
+                User.name.label('user_name'),
+                FoodLog.food_name,
+                FoodLog.portion_size,
+                FoodLog.calorie_count,
+                FoodLog.protein,
+                FoodLog.carbohydrates,
+                FoodLog.fiber,
+                FoodLog.fat,
+                FoodLog.sugar,
+                FoodLog.timestamp
+            )
+            .join(User, FoodLog.user_id == User.id)
+            .join(Household, FoodLog.household_id == Household.id)
+            .where(FoodLog.household_id.in_(household_ids))
+            .order_by(FoodLog.timestamp.desc())
+            .limit(5)
+        ).mappings().all()
     
     return templates.TemplateResponse("index.html", {
         "request": request,
         "user": user,
-        "households": households,
-        "pending_invitations": pending_invitations,
-        "primary_household": primary_household,
+        **dashboard_ctx,
         "recent_logs": recent_logs,
         "total_calories": round(total_calories, 0),
         "total_protein": round(total_protein, 1),
@@ -520,30 +615,47 @@ async def read_form(
         "total_sugar": round(total_sugar, 1),
         "nutrition_per_person": nutrition_per_person,
         "start_date": start_dt.strftime("%Y-%m-%d"),
-        "end_date": end_dt.strftime("%Y-%m-%d")
+        "end_date": end_dt.strftime("%Y-%m-%d"),
+        "message": message
     })
 
 @app.get('/manage_household', response_class=HTMLResponse)
-async def manage_household(
+def manage_household(
     request: Request, 
+    household_id: int = Query(None),
+    message: str = Query(None),
+    error: str = Query(None),
     admin: User = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
-    # Only show households the admin is a member of
-    households = admin.households
-    # Get users who are not in any household
-    users_with_households = db.query(User.id).join(UserHouseholdAssociation).distinct()
-    users_without_household = db.query(User).filter(~User.id.in_(users_with_households)).all()
+    # Only show households the admin is a member of; the page shows each one's
+    # member count, so load all their members in one IN query
+    households = db.query(Household)\
+        .options(selectinload(Household.members))\
+        .filter(Household.id.in_(user_household_ids_subquery(admin.id)))\
+        .all()
+    
+    # After an invite, list that household's pending invitations, but only for a
+    # household the admin belongs to
+    pending_invitations = []
+    if any(h.id == household_id for h in households):
+        pending_invitations = db.query(HouseholdInvitation).filter(
+            HouseholdInvitation.household_id == household_id,
+            HouseholdInvitation.status == InvitationStatus.PENDING
+        ).all()
     
     return templates.TemplateResponse("household_form.html", {
         "request": request,
         "user": admin,
         "households": households,
-        "available_users": users_without_household
+        "invite_url": request.session.pop('invite_url', None),
+        "pending_invitations": pending_invitations,
+        "message": message,
+        "error_message": error
     })
 
 @app.post('/create_household', response_class=HTMLResponse)
-async def create_household(
+def create_household(
     request: Request,
     household_name: str = Form(...),
     admin: User = Depends(require_admin),
@@ -553,100 +665,53 @@ async def create_household(
         # Check if household already exists
         existing_household = db.query(Household).filter(Household.name == household_name).first()
         if existing_household:
-            households = db.query(Household).all()
-            # Get pending invitations for admin
-            pending_invitations = []
-            if admin.email:
-                pending_invitations = db.query(HouseholdInvitation).join(Household).filter(
-                    HouseholdInvitation.email == admin.email,
-                    HouseholdInvitation.status == InvitationStatus.PENDING
-                ).all()
-            return templates.TemplateResponse("index.html", {
-                "request": request,
-                "user": admin,
-                "households": households,
-                "pending_invitations": pending_invitations,
-                "primary_household": admin.get_primary_household(),
-                "message": f"Household '{household_name}' already exists!"
-            })
+            error = f"Household '{household_name}' already exists!"
+            return RedirectResponse(url=f'/manage_household?{urlencode({"error": error})}', status_code=303)
 
         # Create new household
         household = Household(name=household_name)
         db.add(household)
         
-        # Store admin ID before commit (to avoid session detachment issues)
+        # Store admin ID and membership state before commit (to avoid session detachment issues)
         admin_id = admin.id
+        is_first_household = not admin.households
         
         try:
             db.commit()
             db.refresh(household)
             
-            # Re-query the admin user to check their current households
-            admin = db.query(User).filter(User.id == admin_id).first()
-            
             # Add the creator as a member of the new household
-            is_first_household = len(admin.households) == 0
             association = UserHouseholdAssociation(
-                user_id=admin.id,
+                user_id=admin_id,
                 household_id=household.id,
                 is_primary=is_first_household  # Set as primary if it's their first household
             )
             db.add(association)
             db.commit()
-            db.refresh(admin)  # Refresh admin to get updated households list
             
         except Exception as db_error:
             db.rollback()
             print(f"Database error: {str(db_error)}")
             raise HTTPException(status_code=500, detail="Database error occurred")
 
-        # Get updated list of households
-        households = db.query(Household).all()
-        # Get pending invitations for admin
-        pending_invitations = []
-        if admin.email:
-            pending_invitations = db.query(HouseholdInvitation).join(Household).filter(
-                HouseholdInvitation.email == admin.email,
-                HouseholdInvitation.status == InvitationStatus.PENDING
-            ).all()
-        return templates.TemplateResponse("index.html", {
-            "request": request,
-            "user": admin,
-            "households": households,
-            "pending_invitations": pending_invitations,
-            "primary_household": admin.get_primary_household(),
-            "message": f"Household '{household_name}' created successfully!"
-        })
+        message = f"Household '{household_name}' created successfully!"
+        return RedirectResponse(url=f'/?{urlencode({"message": message})}', status_code=303)
     except HTTPException as he:
         raise he
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
-        households = db.query(Household).all()
-        # Get pending invitations for admin
-        pending_invitations = []
-        if admin.email:
-            pending_invitations = db.query(HouseholdInvitation).join(Household).filter(
-                HouseholdInvitation.email == admin.email,
-                HouseholdInvitation.status == InvitationStatus.PENDING
-            ).all()
-        return templates.TemplateResponse("index.html", {
-            "request": request,
-            "user": admin,
-            "households": households,
-            "pending_invitations": pending_invitations,
-            "primary_household": admin.get_primary_household(),
-            "message": "An unexpected error occurred while creating the household."
-        }, status_code=500)
+        error = "An unexpected error occurred while creating the household."
+        return RedirectResponse(url=f'/manage_household?{urlencode({"error": error})}', status_code=303)
 
 @app.post('/delete_household', response_class=HTMLResponse)
-async def delete_household(
+def delete_household(
     request: Request,
     household_id: int = Form(...),
     admin: User = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
     # Check if household exists
-    household = db.query(Household).filter(Household.id == household_id).first()
+    household = db.get(Household, household_id)
     if not household:
         raise HTTPException(status_code=404, detail="Household not found")
     
@@ -660,22 +725,22 @@ async def delete_household(
     household_name = household.name
     
     try:
+        # The foreign keys declare ON DELETE CASCADE, but SQLite doesn't enforce them and
+        # can't add them to existing tables, so the dependent rows are removed explicitly
         # Delete all food logs associated with this household
-        db.query(FoodLog).filter(FoodLog.household_id == household_id).delete()
+        db.query(FoodLog).filter(FoodLog.household_id == household_id).delete(synchronize_session=False)
         
         # Delete all invitations associated with this household
-        db.query(HouseholdInvitation).filter(HouseholdInvitation.household_id == household_id).delete()
+        db.query(HouseholdInvitation).filter(HouseholdInvitation.household_id == household_id).delete(synchronize_session=False)
         
         # Delete all user-household associations
-        db.query(UserHouseholdAssociation).filter(UserHouseholdAssociation.household_id == household_id).delete()
+        db.query(UserHouseholdAssociation).filter(UserHouseholdAssociation.household_id == household_id).delete(synchronize_session=False)
         
-        # Delete the household
-        db.delete(household)
+        # Delete the household with a plain DELETE; db.delete() would first load its
+        # members and invitations collections
+        db.query(Household).filter(Household.id == household_id).delete(synchronize_session=False)
         db.commit()
         
-        # Refresh admin to update their households list
-        db.refresh(admin)
-        
     except Exception as e:
         db.rollback()
         print(f"Error deleting household: {str(e)}")
@@ -684,7 +749,7 @@ async def delete_household(
     return RedirectResponse(url='/manage_household', status_code=303)
 
 @app.post('/add_member', response_class=HTMLResponse)
-async def add_member(
+def add_member(
     request: Request,
     household_id: int = Form(...),
     user_id: int = Form(...),
@@ -692,7 +757,7 @@ async def add_member(
     db: Session = Depends(get_db)
 ):
     # Get the user to add
-    user_to_add = db.query(User).filter(User.id == user_id).first()
+    user_to_add = db.get(User, user_id)
     if not user_to_add:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -704,7 +769,7 @@ async def add_member(
     association = UserHouseholdAssociation(
         user_id=user_to_add.id,
         household_id=household_id,
-        is_primary=len(user_to_add.households) == 0  # Set as primary if it's the first household
+        is_primary=not user_to_add.households  # Set as primary if it's the first household
     )
     db.add(association)
     db.commit()
@@ -712,19 +777,16 @@ async def add_member(
     return RedirectResponse(url='/manage_household', status_code=303)
 
 @app.post('/add_self_to_household', response_class=HTMLResponse)
-async def add_self_to_household(
+def add_self_to_household(
     request: Request,
     household_id: int = Form(...),
     set_as_primary: bool = Form(False, alias="set_as_primary"),
-    auth_user: User = Depends(require_user),
+    current_user: User = Depends(require_user),
     db: Session = Depends(get_db)
 ):
     try:
-        user_id = auth_user.id  # Store the user ID for later retrieval
-        current_user = db.query(User).get(user_id)  
-        
         # Check if household exists
-        household = db.query(Household).filter(Household.id == household_id).first()
+        household = db.get(Household, household_id)
         if not household:
             return templates.TemplateResponse("error.html", {
                 "request": request,
@@ -733,7 +795,7 @@ async def add_self_to_household(
             })
         
         # Check if user is already in this household
-        if household in current_user.households:
+        if user_in_household(current_user, household.id):
             return templates.TemplateResponse("error.html", {
                 "request": request,
                 "user": current_user,
@@ -744,45 +806,23 @@ async def add_self_to_household(
         association = UserHouseholdAssociation(
             user_id=current_user.id,
             household_id=household_id,
-            is_primary=set_as_primary or len(current_user.households) == 0  # Set as primary if requested or if it's the first household
+            is_primary=set_as_primary or not current_user.households  # Set as primary if requested or if it's the first household
         )
         
         # If this is set as primary, unset any existing primary
         if set_as_primary:
-            existing_primary = db.query(UserHouseholdAssociation).filter(
-                UserHouseholdAssociation.user_id == current_user.id,
-                UserHouseholdAssociation.is_primary == True
-            ).first()
+            existing_primary = next(
+                (a for a in current_user.household_associations if a.is_primary), None
+            )
             
             if existing_primary:
                 existing_primary.is_primary = False
         
         db.add(association)
         db.commit()
-        db.refresh(current_user)  # Refresh the current_user object with updated data
         
-        # Get pending invitations for this user
-        pending_invitations = []
-        if current_user.email:
-            pending_invitations = db.query(HouseholdInvitation).join(Household).filter(
-                HouseholdInvitation.email == current_user.email,
-                HouseholdInvitation.status == InvitationStatus.PENDING
-            ).all()
-        
-        # Get all households for display
-        if is_admin(current_user):
-            all_households = db.query(Household).all()
-        else:
-            all_households = current_user.households
-            
-        return templates.TemplateResponse("index.html", {
-            "request": request,
-            "user": current_user,
-            "households": all_households,
-            "pending_invitations": pending_invitations,
-            "primary_household": current_user.get_primary_household(),
-            "message": f"You have successfully joined the household: {household.name}"
-        })
+        message = f"You have successfully joined the household: {household.name}"
+        return RedirectResponse(url=f'/?{urlencode({"message": message})}', status_code=303)
     except Exception as e:
         db.rollback()  # Roll back the transaction in case of error
         return templates.TemplateResponse("error.html", {
@@ -792,151 +832,81 @@ async def add_self_to_household(
         })
 
 @app.post('/invite_member', response_class=HTMLResponse)
-async def invite_member(
+def invite_member(
     request: Request,
     household_id: int = Form(...),
     email: str = Form(...),
     admin: User = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
+    email = normalize_email(email)
+    
     # Check if household exists
-    household = db.query(Household).filter(Household.id == household_id).first()
+    household = db.get(Household, household_id)
     if not household:
         raise HTTPException(status_code=404, detail="Household not found")
     
     # Prevent self-invitation
-    if admin.email.lower() == email.lower():
-        # Get users who are not in any household
-        users_with_households = db.query(User.id).join(UserHouseholdAssociation).distinct()
-        return templates.TemplateResponse("household_form.html", {
-            "request": request,
-            "user": admin,
-            "households": db.query(Household).all(),
-            "available_users": db.query(User).filter(~User.id.in_(users_with_households)).all(),
-            "error_message": "You cannot invite yourself. Use 'Join Household' from the home page instead."
-        })
+    if admin.email == email:
+        error = "You cannot invite yourself. Use 'Join Household' from the home page instead."
+        return RedirectResponse(url=f'/manage_household?{urlencode({"error": error})}', status_code=303)
     
     # Check if user with this email already exists
     existing_user = db.query(User).filter(User.email == email).first()
     
-    # Check if there's already a pending invitation for this email and household
-    existing_invitation = db.query(HouseholdInvitation).filter(
-        HouseholdInvitation.email == email,
-        HouseholdInvitation.household_id == household_id,
-        HouseholdInvitation.status == InvitationStatus.PENDING
-    ).first()
+    if existing_user and existing_user.households:
+        error = f"User with email {email} is already in a household"
+        return RedirectResponse(url=f'/manage_household?{urlencode({"error": error})}', status_code=303)
     
-    if existing_invitation:
-        # Return the existing invitation
-        invite_url = f"{request.base_url}join_household?code={existing_invitation.invite_code}"
-        
-        # Get all pending invitations for this household
-        pending_invitations = db.query(HouseholdInvitation).filter(
+    invitation = HouseholdInvitation(
+        email=email,
+        household_id=household_id
+    )
+    db.add(invitation)
+    try:
+        db.commit()
+    except IntegrityError:
+        # ux_pending_invitation: this address already has a pending invitation here
+        db.rollback()
+        existing_invitation = db.query(HouseholdInvitation).filter(
+            HouseholdInvitation.email == email,
             HouseholdInvitation.household_id == household_id,
             HouseholdInvitation.status == InvitationStatus.PENDING
-        ).all()
+        ).first()
         
-        # Get users who are not in any household
-        users_with_households = db.query(User.id).join(UserHouseholdAssociation).distinct()
-        return templates.TemplateResponse("household_form.html", {
-            "request": request,
-            "user": admin,
-            "households": db.query(Household).all(),
-            "available_users": db.query(User).filter(~User.id.in_(users_with_households)).all(),
-            "invite_url": invite_url,
-            "message": f"Invitation for {email} already exists",
-            "pending_invitations": pending_invitations
-        })
+        # The conflict wasn't a pending duplicate, or that invitation was
+        # accepted or rejected in the meantime
+        if existing_invitation is None:
+            query = urlencode({"household_id": household_id, "error": f"Could not create an invitation for {email}. Please try again."})
+            return RedirectResponse(url=f'/manage_household?{query}', status_code=303)
+        
+        # Return the existing invitation
+        request.session['invite_url'] = f"{request.base_url}join_household?code={existing_invitation.invite_code}"
+        query = urlencode({"household_id": household_id, "message": f"Invitation for {email} already exists"})
+        return RedirectResponse(url=f'/manage_household?{query}', status_code=303)
     
     if existing_user:
-        if existing_user.households:
-            return templates.TemplateResponse("household_form.html", {
-                "request": request,
-                "user": admin,
-                "households": db.query(Household).all(),
-                "available_users": db.query(User).filter(~User.id.in_(
-                    db.query(User.id).join(UserHouseholdAssociation).distinct()
-                )).all(),
-                "error_message": f"User with email {email} is already in a household"
-            })
-        else:
-            # Create invitation for existing user
-            invitation = HouseholdInvitation(
-                email=email,
-                household_id=household_id
-            )
-            db.add(invitation)
-            db.commit()
-            db.refresh(invitation)
-            
-            invite_url = f"{BASE_URL}/join_household?code={invitation.invite_code}"
-            
-            # Send invitation email
-            send_household_invitation_email(
-                to_email=email,
-                inviter_name=admin.name,
-                household_name=household.name,
-                invitation_link=invite_url
-            )
-            
-            # Get all pending invitations for this household
-            pending_invitations = db.query(HouseholdInvitation).filter(
-                HouseholdInvitation.household_id == household_id,
-                HouseholdInvitation.status == InvitationStatus.PENDING
-            ).all()
-            
-            return templates.TemplateResponse("household_form.html", {
-                "request": request,
-                "user": admin,
-                "households": db.query(Household).all(),
-                "available_users": db.query(User).filter(~User.id.in_(
-                    db.query(User.id).join(UserHouseholdAssociation).distinct()
-                )).all(),
-                "invite_url": invite_url,
-                "message": f"Invitation email sent to {email}",
-                "pending_invitations": pending_invitations
-            })
+        invite_url = f"{BASE_URL}/join_household?code={invitation.invite_code}"
     else:
-        # Create invitation for new user
-        invitation = HouseholdInvitation(
-            email=email,
-            household_id=household_id
-        )
-        db.add(invitation)
-        db.commit()
-        db.refresh(invitation)
-        
         # Use accept-invite route which will prompt registration
         invite_url = f"{BASE_URL}/accept-invite/{invitation.invite_code}"
-        
-        # Send invitation email
-        send_household_invitation_email(
-            to_email=email,
-            inviter_name=admin.name,
-            household_name=household.name,
-            invitation_link=invite_url
-        )
-        
-        # Get all pending invitations for this household
-        pending_invitations = db.query(HouseholdInvitation).filter(
-            HouseholdInvitation.household_id == household_id,
-            HouseholdInvitation.status == InvitationStatus.PENDING
-        ).all()
-        
-        # Get users who are not in any household
-        users_with_households = db.query(User.id).join(UserHouseholdAssociation).distinct()
-        return templates.TemplateResponse("household_form.html", {
-            "request": request,
-            "user": admin,
-            "households": db.query(Household).all(),
-            "available_users": db.query(User).filter(~User.id.in_(users_with_households)).all(),
-            "invite_url": invite_url,
-            "message": f"Invitation email sent to {email}",
-            "pending_invitations": pending_invitations
-        })
+    
+    # Send invitation email on the email pool
+    queue_email(
+        send_household_invitation_email,
+        to_email=email,
+        inviter_name=admin.name,
+        household_name=household.name,
+        invitation_link=invite_url
+    )
+    
+    # Show the link once on the redirected page
+    request.session['invite_url'] = invite_url
+    query = urlencode({"household_id": household_id, "message": f"Invitation email sent to {email}"})
+    return RedirectResponse(url=f'/manage_household?{query}', status_code=303)
 
 @app.get('/join_household', response_class=HTMLResponse)
-async def join_household(
+def join_household(
     request: Request,
     code: str = Query(...),
     db: Session = Depends(get_db)
@@ -949,21 +919,18 @@ async def join_household(
         request.session['return_url'] = str(request.url)
         return RedirectResponse(url='/login')
     
-    # Find invitation
+    # Find invitation; expired ones are filtered out in the query
     invitation = db.query(HouseholdInvitation).filter(
         HouseholdInvitation.invite_code == code,
-        HouseholdInvitation.status == InvitationStatus.PENDING
+        HouseholdInvitation.status == InvitationStatus.PENDING,
+        invitation_not_expired()
     ).first()
     
     if not invitation:
         raise HTTPException(status_code=404, detail="Invalid or expired invitation")
     
-    # Check if invitation has expired
-    if invitation.expires_at and invitation.expires_at < datetime.datetime.utcnow():
-        raise HTTPException(status_code=400, detail="Invitation has expired")
-    
     # Check if invitation email matches user email
-    if invitation.email.lower() != user.email.lower():
+    if invitation.email != user.email:
         return templates.TemplateResponse("error.html", {
             "request": request,
             "user": user,
@@ -971,14 +938,14 @@ async def join_household(
         })
     
     # Check if user is already in this household
-    if invitation.household in user.households:
+    if user_in_household(user, invitation.household_id):
         # Mark invitation as accepted
         invitation.status = InvitationStatus.ACCEPTED
         db.commit()
         return RedirectResponse(url='/', status_code=303)
     
     # Add user to household
-    is_first_household = len(user.households) == 0
+    is_first_household = not user.households
     association = UserHouseholdAssociation(
         user_id=user.id,
         household_id=invitation.household_id,
@@ -994,70 +961,79 @@ async def join_household(
     return RedirectResponse(url='/', status_code=303)
 
 @app.post('/set_primary_household', response_class=HTMLResponse)
-async def set_primary_household(
+def set_primary_household(
     request: Request,
     household_id: int = Form(...),
     current_user: User = Depends(require_user),
     db: Session = Depends(get_db)
 ):
     # Check if user is in the specified household
-    household = db.query(Household).filter(Household.id == household_id).first()
-    if not household or household not in current_user.households:
+    if not user_in_household(current_user, household_id):
         return templates.TemplateResponse("error.html", {
             "request": request,
             "user": current_user,
             "error_message": "You are not a member of this household."
         })
     
-    # Update the associations
-    # First, unset any existing primary
-    db.query(UserHouseholdAssociation).filter(
-        UserHouseholdAssociation.user_id == current_user.id,
-        UserHouseholdAssociation.is_primary == True
-    ).update({"is_primary": False})
-    
-    # Then set the new primary
-    db.query(UserHouseholdAssociation).filter(
-        UserHouseholdAssociation.user_id == current_user.id,
-        UserHouseholdAssociation.household_id == household_id
-    ).update({"is_primary": True})
+    # Mark the chosen household primary and unset the others in one UPDATE
+    db.execute(
+        update(UserHouseholdAssociation)
+        .where(UserHouseholdAssociation.user_id == current_user.id)
+        .values(is_primary=case((UserHouseholdAssociation.household_id == household_id, True), else_=False))
+        .execution_options(synchronize_session=False)
+    )
     
     db.commit()
     
     return RedirectResponse(url='/', status_code=303)
 
 @app.post('/accept_invitation', response_class=HTMLResponse)
-async def accept_invitation(
+def accept_invitation(
     request: Request,
     invitation_id: int = Form(...),
     current_user: User = Depends(require_user),
     db: Session = Depends(get_db)
 ):
     try:
-        # Find invitation
-        invitation = db.query(HouseholdInvitation).filter(
-            HouseholdInvitation.id == invitation_id,
-            HouseholdInvitation.status == InvitationStatus.PENDING
-        ).first()
-        
-        if not invitation:
-            return templates.TemplateResponse("error.html", {
-                "request": request,
-                "user": current_user,
-                "error_message": "Invitation not found or already processed."
-            })
-        
-        # Check if invitation email matches user email
-        if invitation.email.lower() != current_user.email.lower():
-            return templates.TemplateResponse("error.html", {
-                "request": request,
-                "user": current_user,
-                "error_message": "This invitation was not sent to you."
-            })
+        # Claim the invitation in a single UPDATE: still pending, sent to this user,
+        # unexpired, and its household still exists
+        household_id = db.execute(
+            update(HouseholdInvitation)
+            .where(
+                HouseholdInvitation.id == invitation_id,
+                HouseholdInvitation.status == InvitationStatus.PENDING,
+                invitation_not_expired(),
+                HouseholdInvitation.email == current_user.email,
+                exists().where(Household.id == HouseholdInvitation.household_id)
+            )
+            .values(status=InvitationStatus.ACCEPTED)
+            .returning(HouseholdInvitation.household_id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
         
-        # Check if household exists
-        household = db.query(Household).filter(Household.id == invitation.household_id).first()
-        if not household:
+        if household_id is None:
+            # Nothing was claimed; look the invitation up only to explain why
+            invitation = db.query(HouseholdInvitation).filter(
+                HouseholdInvitation.id == invitation_id,
+                HouseholdInvitation.status == InvitationStatus.PENDING,
+                invitation_not_expired()
+            ).first()
+            
+            if not invitation:
+                return templates.TemplateResponse("error.html", {
+                    "request": request,
+                    "user": current_user,
+                    "error_message": "Invitation not found, expired or already processed."
+                })
+            
+            if invitation.email != current_user.email:
+                return templates.TemplateResponse("error.html", {
+                    "request": request,
+                    "user": current_user,
+                    "error_message": "This invitation was not sent to you."
+                })
+            
+            # Pending and addressed to this user, so its household is gone
             invitation.status = InvitationStatus.REJECTED
             db.commit()
             
@@ -1067,31 +1043,25 @@ async def accept_invitation(
                 "error_message": "The household no longer exists."
             })
         
-        # Check if user is already in this household
-        if household in current_user.households:
-            invitation.status = InvitationStatus.ACCEPTED
-            db.commit()
-            
+        # Add user to household; an existing membership makes this a no-op
+        added = db.execute(
+            sqlite_insert(UserHouseholdAssociation)
+            .values(
+                user_id=current_user.id,
+                household_id=household_id,
+                is_primary=not current_user.households  # Set as primary if it's the first household
+            )
+            .on_conflict_do_nothing()
+        ).rowcount
+        db.commit()
+        
+        if not added:
             return templates.TemplateResponse("error.html", {
                 "request": request,
                 "user": current_user,
                 "error_message": "You are already a member of this household."
             })
         
-        # Add user to household
-        is_first_household = len(current_user.households) == 0
-        association = UserHouseholdAssociation(
-            user_id=current_user.id,
-            household_id=invitation.household_id,
-            is_primary=is_first_household  # Set as primary if it's the first household
-        )
-        db.add(association)
-        
-        # Mark invitation as accepted
-        invitation.status = InvitationStatus.ACCEPTED
-        
-        db.commit()
-        
         return RedirectResponse(url='/', status_code=303)
     except Exception as e:
         return templates.TemplateResponse("error.html", {
@@ -1101,7 +1071,7 @@ async def accept_invitation(
         })
 
 @app.post('/reject_invitation', response_class=HTMLResponse)
-async def reject_invitation(
+def reject_invitation(
     request: Request,
     invitation_id: int = Form(...),
     current_user: User = Depends(require_user),
@@ -1117,7 +1087,7 @@ async def reject_invitation(
         raise HTTPException(status_code=404, detail="Invitation not found")
     
     # Check if invitation email matches user email
-    if invitation.email.lower() != current_user.email.lower():
+    if invitation.email != current_user.email:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="This invitation was not sent to you"
@@ -1131,14 +1101,14 @@ async def reject_invitation(
     return RedirectResponse(url='/', status_code=303)
 
 @app.post('/leave_household', response_class=HTMLResponse)
-async def leave_household(
+def leave_household(
     request: Request,
     household_id: int = Form(...),
     current_user: User = Depends(require_user),
     db: Session = Depends(get_db)
 ):
     # Check if user is in the specified household
-    household = db.query(Household).filter(Household.id == household_id).first()
+    household = db.get(Household, household_id)
     if not household or household not in current_user.households:
         return templates.TemplateResponse("error.html", {
             "request": request,
@@ -1148,13 +1118,17 @@ async def leave_household(
     
     # Check if user is the only admin in the household
     if is_admin(current_user):
-        # Count admins in this household
-        admin_count = 0
-        for member in household.members:
-            if is_admin(member) and member.id != current_user.id:
-                admin_count += 1
+        # Count the other members and the admins among them in one query
+        other_members, other_admins = db.query(
+            func.count(User.id),
+            func.coalesce(func.sum(case((User.role == UserRole.ADMIN, 1), else_=0)), 0)
+        )\
+            .join(UserHouseholdAssociation, UserHouseholdAssociation.user_id == User.id)\
+            .filter(UserHouseholdAssociation.household_id == household_id)\
+            .filter(User.id != current_user.id)\
+            .one()
         
-        if admin_count == 0 and len(household.members) > 1:
+        if other_admins == 0 and other_members > 0:
             return templates.TemplateResponse("error.html", {
                 "request": request,
                 "user": current_user,
@@ -1185,7 +1159,7 @@ async def leave_household(
     return RedirectResponse(url='/', status_code=303)
 
 @app.get('/get_household_members/{household_id}')
-async def get_household_members(
+def get_household_members(
     household_id: int, 
     current_user: User = Depends(require_user),
     db: Session = Depends(get_db)
@@ -1199,25 +1173,17 @@ async def get_household_members(
         )
     
     # Get members of the household through the association table
-    household = db.query(Household).filter(Household.id == household_id).first()
+    household = db.get(Household, household_id)
     if not household:
         raise HTTPException(status_code=404, detail="Household not found")
     
     members = household.members
-    return JSONResponse(content=[{"id": m.id, "name": m.name, "email": m.email} for m in members])
+    return ORJSONResponse(content=[{"id": m.id, "name": m.name, "email": m.email} for m in members])
 
-@app.post('/add_food', response_class=HTMLResponse)
-async def add_food(
-    request: Request,
-    household_id: int = Form(...),
-    user_id: int = Form(...),
-    food_name: str = Form(...),
-    portion_size: str = Form(...),
-    current_user: User = Depends(require_user),
-    db: Session = Depends(get_db)
-):
+def check_food_entry_access(db: Session, current_user: User, user_id: int) -> User:
+    """Load the user a food entry is for, checking the current user may log food for them."""
     # Get user
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -1230,122 +1196,180 @@ async def add_food(
                 detail="Not authorized to add food for other users"
             )
     else:
-        # Admin users can only add food for users in their households
-        current_user_household_ids = [h.id for h in current_user.households]
-        user_household_ids = [h.id for h in user.households]
-        
-        # Check if there's any overlap in households
-        if not any(hid in current_user_household_ids for hid in user_household_ids):
+        # Admin users can only add food for users in their households; check for
+        # a shared household in SQL instead of loading the user's households
+        shares_household = db.query(
+            exists().where(
+                UserHouseholdAssociation.user_id == user.id,
+                UserHouseholdAssociation.household_id.in_(user_household_ids_subquery(current_user.id))
+            )
+        ).scalar()
+        if not shares_household:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Not authorized to add food for users outside your households"
             )
 
+    # End the read transaction so the pooled connection isn't held through the
+    # AI call that follows; save_food_log checks one out again
+    db.commit()
+    return user
+
+def add_food_logs(db: Session, rows: list):
+    """Insert food log rows (dicts of FoodLog columns) in one executemany and commit."""
+    # A Core insert skips the ORM unit of work and the refresh SELECT per entry;
+    # column defaults such as timestamp still apply
+    db.execute(insert(FoodLog), rows)
+    db.commit()
+
+def save_food_log(db: Session, user: User, household_id: int,
+                  food_name: str, portion_size: str, nutrition: dict) -> str:
+    """Store a food log entry and return the confirmation message."""
+    # Read the name before add_food_logs commits and expires the user again
+    user_name = user.name
+
+    # Add food log entry with full nutritional info
+    add_food_logs(db, [{
+        'user_id': user.id,
+        'household_id': household_id,
+        'food_name': food_name,
+        'portion_size': portion_size,
+        'calorie_count': nutrition['calories'],
+        'protein': nutrition['protein'],
+        'carbohydrates': nutrition['carbohydrates'],
+        'fiber': nutrition['fiber'],
+        'fat': nutrition['fat'],
+        'sugar': nutrition['sugar']
+    }])
+
+    return f"Entry added for {user_name}. Calories: {nutrition['calories']:.0f} | Protein: {nutrition['protein']:.1f}g | Carbs: {nutrition['carbohydrates']:.1f}g | Fat: {nutrition['fat']:.1f}g"
+
+@app.post('/add_food', response_class=HTMLResponse)
+async def add_food(
+    request: Request,
+    household_id: int = Form(...),
+    user_id: int = Form(...),
+    food_name: str = Form(...),
+    portion_size: str = Form(...),
+    current_user: User = Depends(require_user),
+    db: Session = Depends(get_db)
+):
+    # This handler stays async for the AI call; the database work before and
+    # after it runs on the threadpool
+    user = await run_in_threadpool(check_food_entry_access, db, current_user, user_id)
+
     # Get nutritional information from preferred AI
     nutrition = await get_nutrition_info(food_name, portion_size)
 
-    # Add food log entry with full nutritional info
-    food_log = FoodLog(
-        user_id=user.id,
-        household_id=household_id,
-        food_name=food_name,
-        portion_size=portion_size,
-        calorie_count=nutrition['calories'],
-        protein=nutrition['protein'],
-        carbohydrates=nutrition['carbohydrates'],
-        fiber=nutrition['fiber'],
-        fat=nutrition['fat'],
-        sugar=nutrition['sugar']
+    message = await run_in_threadpool(
+        save_food_log, db, user, household_id, food_name, portion_size, nutrition
     )
-    db.add(food_log)
-    db.commit()
-    db.refresh(food_log)
+    # Show the entry on the dashboard, which has the totals and recent logs
+    return RedirectResponse(url=f'/?{urlencode({"message": message})}', status_code=303)
 
-    message = f"Entry added for {user.name}. Calories: {nutrition['calories']:.0f} | Protein: {nutrition['protein']:.1f}g | Carbs: {nutrition['carbohydrates']:.1f}g | Fat: {nutrition['fat']:.1f}g"
-    return templates.TemplateResponse("index.html", {
-        "request": request, 
-        "user": current_user,
-        "message": message,
-        "primary_household": current_user.get_primary_household(),
-        "households": current_user.households if not is_admin(current_user) else db.query(Household).all()
-    })
+# Nutrition lookups run at temperature 0, so a repeated food and portion reuses
+# the earlier estimate instead of paying for another API round trip
+NUTRITION_CACHE_TTL_SECONDS = 30 * 24 * 3600
+NUTRITION_CACHE_MAX_ENTRIES = 2048
+NUTRIENT_KEYS = ('calories', 'protein', 'carbohydrates', 'fiber', 'fat', 'sugar')
+_nutrition_cache = OrderedDict()
+
+def empty_nutrition():
+    return dict.fromkeys(NUTRIENT_KEYS, 0)
+
+def _normalize_food_text(text):
+    """Lowercase and collapse whitespace so trivially different inputs share a cache entry."""
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+def parse_nutrition(response_text):
+    """Parse a provider's JSON reply into non-negative floats, or all zeros if it doesn't fit."""
+    try:
+        nutrition = json.loads(response_text)
+        parsed = {key: float(nutrition.get(key) or 0) for key in NUTRIENT_KEYS}
+    except (json.JSONDecodeError, ValueError, TypeError, AttributeError) as e:
+        logger.warning("Failed to parse nutrition response: %s", e)
+        return empty_nutrition()
+    
+    if any(value < 0 for value in parsed.values()):
+        logger.warning("Nutrition response has negative values: %s", response_text)
+        return empty_nutrition()
+    return parsed
 
 async def get_nutrition_info(food_name, portion_size):
     """Get complete nutritional information from AI"""
+    key = (config.PREFERRED_AI, _normalize_food_text(food_name), _normalize_food_text(portion_size))
+    cached = _nutrition_cache.get(key)
+    if cached and time.monotonic() - cached[0] < NUTRITION_CACHE_TTL_SECONDS:
+        _nutrition_cache.move_to_end(key)
+        return dict(cached[1])
+    
     if config.PREFERRED_AI == 'openai':
-        return await get_nutrition_from_openai(food_name, portion_size)
+        response_text = await get_nutrition_from_openai(food_name, portion_size)
     elif config.PREFERRED_AI == 'anthropic':
-        return await get_nutrition_from_anthropic(food_name, portion_size)
+        response_text = await get_nutrition_from_anthropic(food_name, portion_size)
     else:
-        return {'calories': 0, 'protein': 0, 'carbohydrates': 0, 'fiber': 0, 'fat': 0, 'sugar': 0}
+        return empty_nutrition()
+    
+    if response_text is None:
+        return empty_nutrition()
+    nutrition = parse_nutrition(response_text)
+    
+    # All zeros is what an unparseable reply returns; don't keep it
+    if any(nutrition.values()):
+        _nutrition_cache[key] = (time.monotonic(), dict(nutrition))
+        _nutrition_cache.move_to_end(key)
+        if len(_nutrition_cache) > NUTRITION_CACHE_MAX_ENTRIES:
+            _nutrition_cache.popitem(last=False)
+    return nutrition
 
 async def get_nutrition_from_openai(food_name, portion_size):
-    import json
+    """Ask OpenAI for a nutrition estimate; returns the raw JSON reply, or None without a client."""
+    client = _get_openai_client()
     if not client:
-        print("OpenAI client not initialized (missing API key)")
-        return {'calories': 0, 'protein': 0, 'carbohydrates': 0, 'fiber': 0, 'fat': 0, 'sugar': 0}
+        logger.warning("OpenAI client not initialized (missing API key)")
+        return None
         
-    prompt = f"""Estimate the nutritional information for {portion_size} of {food_name}.
-Respond with ONLY a JSON object in this exact format, no other text:
-{{"calories": <number>, "protein": <grams>, "carbohydrates": <grams>, "fiber": <grams>, "fat": <grams>, "sugar": <grams>}}"""
+    # JSON mode guarantees a parseable object, so the prompt only names the keys
+    prompt = (f"Estimate the nutrition for {portion_size} of {food_name} as JSON with numeric keys "
+              "calories, protein, carbohydrates, fiber, fat, sugar (grams except calories).")
     
-    print(f"OpenAI Nutrition Prompt: {prompt}")
-    response = client.chat.completions.create(
+    logger.debug("OpenAI nutrition prompt: %s", prompt)
+    response = await client.chat.completions.create(
         model="gpt-3.5-turbo",
         messages=[{"role": "user", "content": prompt}],
+        response_format={"type": "json_object"},
         max_tokens=100,
         temperature=0.0
     )
     response_text = response.choices[0].message.content.strip()
-    print(f"OpenAI Response: {response_text}")
-    
-    try:
-        nutrition = json.loads(response_text)
-        return {
-            'calories': float(nutrition.get('calories', 0)),
-            'protein': float(nutrition.get('protein', 0)),
-            'carbohydrates': float(nutrition.get('carbohydrates', 0)),
-            'fiber': float(nutrition.get('fiber', 0)),
-            'fat': float(nutrition.get('fat', 0)),
-            'sugar': float(nutrition.get('sugar', 0))
-        }
-    except (json.JSONDecodeError, ValueError) as e:
-        print(f"Failed to parse nutrition response: {e}")
-        return {'calories': 0, 'protein': 0, 'carbohydrates': 0, 'fiber': 0, 'fat': 0, 'sugar': 0}
+    logger.debug("OpenAI response: %s", response_text)
+    return response_text
 
 async def get_nutrition_from_anthropic(food_name, portion_size):
-    import json
+    """Ask Anthropic for a nutrition estimate; returns the raw JSON reply, or None without a client."""
+    anthropic_client = _get_anthropic_client()
     if not anthropic_client:
-        print("Anthropic client not initialized (missing API key)")
-        return {'calories': 0, 'protein': 0, 'carbohydrates': 0, 'fiber': 0, 'fat': 0, 'sugar': 0}
+        logger.warning("Anthropic client not initialized (missing API key)")
+        return None
         
     prompt = f"""Estimate the nutritional information for {portion_size} of {food_name}.
 Respond with ONLY a JSON object in this exact format, no other text:
 {{"calories": <number>, "protein": <grams>, "carbohydrates": <grams>, "fiber": <grams>, "fat": <grams>, "sugar": <grams>}}"""
     
-    print(f"Anthropic Nutrition Prompt: {prompt}")
-    response = anthropic_client.messages.create(
+    logger.debug("Anthropic nutrition prompt: %s", prompt)
+    # Prefill the opening brace so the reply continues straight into the JSON object
+    response = await anthropic_client.messages.create(
         model="claude-3-haiku-20240307",
         max_tokens=100,
         temperature=0,
-        messages=[{"role": "user", "content": prompt}]
+        messages=[
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": "{"}
+        ]
     )
-    response_text = response.content[0].text.strip()
-    print(f"Anthropic Response: {response_text}")
-    
-    try:
-        nutrition = json.loads(response_text)
-        return {
-            'calories': float(nutrition.get('calories', 0)),
-            'protein': float(nutrition.get('protein', 0)),
-            'carbohydrates': float(nutrition.get('carbohydrates', 0)),
-            'fiber': float(nutrition.get('fiber', 0)),
-            'fat': float(nutrition.get('fat', 0)),
-            'sugar': float(nutrition.get('sugar', 0))
-        }
-    except (json.JSONDecodeError, ValueError) as e:
-        print(f"Failed to parse nutrition response: {e}")
-        return {'calories': 0, 'protein': 0, 'carbohydrates': 0, 'fiber': 0, 'fat': 0, 'sugar': 0}
+    response_text = "{" + response.content[0].text.strip()
+    logger.debug("Anthropic response: %s", response_text)
+    return response_text
 
 # Keep legacy function for backward compatibility
 async def get_calorie_count(food_name, portion_size):
@@ -1354,35 +1378,38 @@ async def get_calorie_count(food_name, portion_size):
 
 
 @app.get('/view_logs', response_class=HTMLResponse)
-async def view_logs(
+def view_logs(
     request: Request, 
+    page: int = Query(1, ge=1),
+    size: int = Query(50, ge=1, le=200),
     current_user: User = Depends(require_user),
     db: Session = Depends(get_db)
 ):
+    # Load each log with its user and household in the same statement
+    logs_query = db.query(FoodLog).options(
+        joinedload(FoodLog.user, innerjoin=True),
+        joinedload(FoodLog.household, innerjoin=True)
+    )
+    
     # For admins, get all logs; for regular users, get only logs from their households
-    if is_admin(current_user):
-        logs = db.query(FoodLog, User, Household)\
-            .select_from(FoodLog)\
-            .join(User, FoodLog.user_id == User.id)\
-            .join(Household, FoodLog.household_id == Household.id)\
-            .all()
-    else:
-        # Get IDs of all households the user belongs to
-        household_ids = [h.id for h in current_user.households]
-        
-        logs = db.query(FoodLog, User, Household)\
-            .select_from(FoodLog)\
-            .join(User, FoodLog.user_id == User.id)\
-            .join(Household, FoodLog.household_id == Household.id)\
-            .filter(FoodLog.household_id.in_(household_ids))\
-            .all()
+    if not is_admin(current_user):
+        logs_query = logs_query.filter(FoodLog.household_id.in_(user_household_ids_subquery(current_user.id)))
+    
+    # Newest first, one page at a time; fetch one extra row to know if there's a next page
+    logs = logs_query\
+        .order_by(FoodLog.timestamp.desc(), FoodLog.id.desc())\
+        .offset((page - 1) * size)\
+        .limit(size + 1)\
+        .all()
+    has_next = len(logs) > size
+    logs = logs[:size]
     
     # Format the data for display
     formatted_logs = []
-    for log, user, household in logs:
+    for log in logs:
         formatted_logs.append({
-            'household_name': household.name,
-            'user_name': user.name,
+            'household_name': log.household.name,
+            'user_name': log.user.name,
             'food_name': log.food_name,
             'portion_size': log.portion_size,
             'calorie_count': log.calorie_count,
@@ -1396,22 +1423,33 @@ async def view_logs(
     
     return templates.TemplateResponse(
         "view_logs.html", 
-        {"request": request, "user": current_user, "logs": formatted_logs}
+        {
+            "request": request,
+            "user": current_user,
+            "logs": formatted_logs,
+            "page": page,
+            "size": size,
+            "has_next": has_next
+        }
     )
 @app.get('/manage_users', response_class=HTMLResponse)
-async def manage_users(
+def manage_users(
     request: Request,
     admin: User = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
-    users = db.query(User).all()
+    # Each row shows the user's primary household; batch-load what
+    # get_primary_household reads instead of lazy loading it per user
+    users = db.query(User).options(
+        selectinload(User.household_associations).joinedload(UserHouseholdAssociation.household)
+    ).all()
     return templates.TemplateResponse(
         "manage_users.html",
         {"request": request, "user": admin, "users": users}
     )
 
 @app.post('/update_user_role', response_class=HTMLResponse)
-async def update_user_role(
+def update_user_role(
     request: Request,
     user_id: int = Form(...),
     role: str = Form(...),
@@ -1425,7 +1463,7 @@ async def update_user_role(
             detail="Cannot change your own role"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -1437,4 +1475,4 @@ async def update_user_role(
     except ValueError:
         message = f"Invalid role: {role}"
     
-    return await manage_users(request, admin, db)
+    return manage_users(request, admin, db)
@@ -1,13 +1,14 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Enum, Table
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import func, Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Enum, Table, Index
+from sqlalchemy.orm import relationship, declarative_base, deferred
 import datetime
 import enum
-import uuid
+import secrets
 
 Base = declarative_base()
 
 def generate_invite_code():
-    return str(uuid.uuid4())
+    # 128 random bits as a 22-character URL-safe token; older UUID codes still match
+    return secrets.token_urlsafe(16)
 
 class UserRole(enum.Enum):
     ADMIN = "admin"
@@ -21,7 +22,9 @@ class Household(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     
     # Relationships
-    members = relationship('User', secondary='user_household_association', back_populates='households')
+    # Read-only shortcut through the association table; memberships are written
+    # via UserHouseholdAssociation
+    members = relationship('User', secondary='user_household_association', viewonly=True)
     invitations = relationship('HouseholdInvitation', back_populates='household')
 
 class User(Base):
@@ -33,46 +36,51 @@ class User(Base):
     
     # Email verification
     is_email_verified = Column(Boolean, default=False)
-    email_verification_token = Column(String, nullable=True)
+    email_verification_token = Column(String, nullable=True, index=True)  # SHA-256 of the emailed token
     email_verification_expires = Column(DateTime, nullable=True)
     
     # Password reset
-    password_reset_token = Column(String, nullable=True)
+    password_reset_token = Column(String, nullable=True, index=True)  # SHA-256 of the emailed token
     password_reset_expires = Column(DateTime, nullable=True)
     
     role = Column(Enum(UserRole), default=UserRole.MEMBER)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     
-    # Nutritional preferences and goals
-    daily_calorie_goal = Column(Integer, nullable=True)
-    is_vegetarian = Column(Boolean, default=False)
-    is_vegan = Column(Boolean, default=False)
-    has_gluten_allergy = Column(Boolean, default=False)
-    has_nut_allergy = Column(Boolean, default=False)
-    additional_preferences = Column(String, nullable=True)
+    # Nutritional preferences and goals; no page reads these yet, so they load
+    # together on first access (or with undefer_group('profile')) instead of
+    # with every user row
+    daily_calorie_goal = deferred(Column(Integer, nullable=True), group='profile')
+    is_vegetarian = deferred(Column(Boolean, default=False), group='profile')
+    is_vegan = deferred(Column(Boolean, default=False), group='profile')
+    has_gluten_allergy = deferred(Column(Boolean, default=False), group='profile')
+    has_nut_allergy = deferred(Column(Boolean, default=False), group='profile')
+    additional_preferences = deferred(Column(String, nullable=True), group='profile')
 
     # Relationships
-    household_associations = relationship('UserHouseholdAssociation', back_populates='user', overlaps="members")
-    households = relationship('Household', secondary='user_household_association', back_populates='members', overlaps="household_associations")
+    household_associations = relationship('UserHouseholdAssociation', back_populates='user')
+    # Read-only, like Household.members, so it doesn't overlap household_associations
+    households = relationship('Household', secondary='user_household_association', viewonly=True)
     food_logs = relationship('FoodLog', back_populates='user')
     
     def get_primary_household(self):
         """Get the user's primary household if set"""
-        for assoc in self.household_associations:
-            if assoc.is_primary:
-                return assoc.household
-        # If no primary is set but user has households, return the first one
-        return self.households[0] if self.households else None
+        associations = self.household_associations
+        primary = next((assoc for assoc in associations if assoc.is_primary), None)
+        # If no primary is set but user has households, return the first one.
+        # Falls back through the same collection so `households` needn't be loaded.
+        if primary is None and associations:
+            primary = associations[0]
+        return primary.household if primary is not None else None
 
 class UserHouseholdAssociation(Base):
     __tablename__ = 'user_household_association'
     user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
-    household_id = Column(Integer, ForeignKey('households.id'), primary_key=True)
+    household_id = Column(Integer, ForeignKey('households.id', ondelete='CASCADE'), primary_key=True)
     is_primary = Column(Boolean, default=False)
     joined_at = Column(DateTime, default=datetime.datetime.utcnow)
     
-    user = relationship('User', back_populates='household_associations', overlaps="households,members")
-    household = relationship('Household', overlaps="households,members")
+    user = relationship('User', back_populates='household_associations')
+    household = relationship('Household')
 
 class InvitationStatus(enum.Enum):
     PENDING = "pending"
@@ -89,7 +97,7 @@ class HouseholdInvitation(Base):
     status = Column(Enum(InvitationStatus), default=InvitationStatus.PENDING)
     
     # Relationships
-    household_id = Column(Integer, ForeignKey('households.id'))
+    household_id = Column(Integer, ForeignKey('households.id', ondelete='CASCADE'))
     household = relationship('Household', back_populates='invitations')
 
 class FoodLog(Base):
@@ -112,6 +120,32 @@ class FoodLog(Base):
     user = relationship('User', back_populates='food_logs')
     
     # Add household_id to track which household this food log belongs to
-    household_id = Column(Integer, ForeignKey('households.id'))
+    household_id = Column(Integer, ForeignKey('households.id', ondelete='CASCADE'))
     household = relationship('Household')
 
+# Serves the dashboard's household/date-range filters and newest-first ordering
+Index('ix_foodlog_household_ts', FoodLog.household_id, FoodLog.timestamp.desc())
+
+# Per-user daily totals (utils.query_daily_calories)
+Index('ix_foodlog_user_ts', FoodLog.user_id, FoodLog.timestamp)
+
+# The admin's unfiltered /view_logs feed: newest first without sorting the whole table
+# (rows with equal timestamps come out in id order, which the index carries implicitly)
+Index('ix_foodlog_ts', FoodLog.timestamp)
+
+# Emails are stored lowercased; this keeps addresses unique regardless of case
+Index('ix_users_email_lower', func.lower(User.email), unique=True)
+
+# Pending-invitation lookups per household (manage page, duplicate-invite check);
+# invite_code lookups already use the index behind its unique constraint
+Index('ix_inv_household_status', HouseholdInvitation.household_id, HouseholdInvitation.status)
+
+# At most one pending invitation per address and household; invite_member relies
+# on this instead of checking first
+Index(
+    'ux_pending_invitation',
+    HouseholdInvitation.email,
+    HouseholdInvitation.household_id,
+    unique=True,
+    sqlite_where=HouseholdInvitation.status == InvitationStatus.PENDING
+)
@@ -0,0 +1,42 @@
+"""Rate limiting for the unauthenticated login and password reset endpoints."""
+
+import os
+from fastapi import Request
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+from slowapi import Limiter
+from auth import normalize_email
+
+
+# Number of proxies in front of the app that append to X-Forwarded-For
+# (Railway's edge is one); 0 ignores the header and uses the peer address
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '1'))
+
+
+def get_client_ip(request: Request) -> str:
+    """Get the client IP as seen by the outermost trusted proxy."""
+    # Entries left of the ones our proxies appended come from the client and can
+    # be anything, so they must not decide which rate-limit bucket a request uses
+    forwarded_for = request.headers.get('x-forwarded-for')
+    if forwarded_for and TRUSTED_PROXY_HOPS > 0:
+        hops = [hop.strip() for hop in forwarded_for.split(',')]
+        return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    return request.client.host if request.client else 'unknown'
+
+
+# Per-IP limits, applied with the @limiter.limit decorator
+limiter = Limiter(key_func=get_client_ip)
+
+# Per-email limits; the decorator's key function can't see form fields
+_email_limiter = FixedWindowRateLimiter(MemoryStorage())
+
+
+def email_within_limit(scope: str, email: str, limit: str) -> bool:
+    """Record an attempt for an email address and check it is within the limit."""
+    return _email_limiter.hit(parse(limit), scope, normalize_email(email))
+
+
+def email_has_attempts_left(scope: str, email: str, limit: str) -> bool:
+    """Check an email address is within the limit without recording an attempt."""
+    return _email_limiter.test(parse(limit), scope, normalize_email(email))
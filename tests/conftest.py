@@ -0,0 +1,135 @@
+import os
+from contextlib import contextmanager
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+ADMIN_EMAIL = "admin@example.com"
+MEMBER_EMAIL = "member@example.com"
+PASSWORD = "password123"
+MEMBER_HOUSEHOLD_COUNT = 3
+
+
+@pytest.fixture(scope="session", autouse=True)
+def test_database(tmp_path_factory):
+    """Point the app at a throwaway SQLite file before database/main are imported."""
+    os.environ["DATABASE_PATH"] = str(tmp_path_factory.mktemp("db") / "test.db")
+
+
+@pytest.fixture(scope="session")
+def app(test_database):
+    from main import app
+    return app
+
+
+@pytest.fixture
+def db(test_database):
+    from database import SessionLocal
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _create_user(session, name, email, role):
+    from auth import hash_password
+    from models import User
+    user = User(
+        name=name,
+        email=email,
+        password_hash=hash_password(PASSWORD),
+        is_email_verified=True,
+        role=role
+    )
+    session.add(user)
+    session.flush()
+    return user
+
+
+def _new_client(app):
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+
+
+async def _login(client, email):
+    response = await client.post("/login", data={"email": email, "password": PASSWORD})
+    assert response.status_code == 303
+
+
+@pytest.fixture(scope="session")
+async def client(app):
+    # One anonymous client for the whole run; requests go straight to the ASGI app
+    async with _new_client(app) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+async def admin_client(app):
+    """A separate client logged in as a verified admin."""
+    from database import SessionLocal
+    from models import UserRole
+    session = SessionLocal()
+    try:
+        _create_user(session, "Test Admin", ADMIN_EMAIL, UserRole.ADMIN)
+        session.commit()
+    finally:
+        session.close()
+
+    async with _new_client(app) as c:
+        await _login(c, ADMIN_EMAIL)
+        yield c
+
+
+@pytest.fixture(scope="session")
+def member_household_ids(test_database):
+    """Create a verified member of several households, each with one other member."""
+    from database import SessionLocal
+    from models import Household, UserHouseholdAssociation, UserRole
+    session = SessionLocal()
+    try:
+        member = _create_user(session, "Test Member", MEMBER_EMAIL, UserRole.MEMBER)
+        household_ids = []
+        for i in range(MEMBER_HOUSEHOLD_COUNT):
+            household = Household(name=f"Member Household {i}")
+            other = _create_user(session, f"Housemate {i}", f"housemate{i}@example.com", UserRole.MEMBER)
+            session.add(household)
+            session.flush()
+            session.add_all([
+                UserHouseholdAssociation(user_id=member.id, household_id=household.id, is_primary=i == 0),
+                UserHouseholdAssociation(user_id=other.id, household_id=household.id)
+            ])
+            household_ids.append(household.id)
+        session.commit()
+        return household_ids
+    finally:
+        session.close()
+
+
+@pytest.fixture(scope="session")
+async def member_client(app, member_household_ids):
+    """A separate client logged in as that member."""
+    async with _new_client(app) as c:
+        await _login(c, MEMBER_EMAIL)
+        yield c
+
+
+@contextmanager
+def _count_queries():
+    """Collect the SQL statements run on the engine inside the block."""
+    from sqlalchemy import event
+    from database import engine
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def count_queries(test_database):
+    return _count_queries
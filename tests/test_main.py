@@ -1,53 +1,135 @@
-import pytest
-from fastapi.testclient import TestClient
-from main import app
+from models import Household, User, UserRole
 
-client = TestClient(app)
 
-def test_read_form():
-    response = client.get("/")
+async def test_read_form(client):
+    response = await client.get("/")
     assert response.status_code == 200
     assert "Philosophers Fridge" in response.text
 
-@pytest.mark.asyncio
-async def test_create_household():
-    response = client.post(
+async def test_create_household(admin_client):
+    response = await admin_client.post(
         "/create_household",
         data={"household_name": "Test Household"}
     )
+    assert response.status_code == 303
+    assert response.headers["location"].startswith("/?message=")
+    
+    # The dashboard shows the confirmation and the new household
+    response = await admin_client.get(response.headers["location"])
     assert response.status_code == 200
     assert "Test Household" in response.text
 
-@pytest.mark.asyncio
-async def test_add_member():
+async def test_add_member(admin_client, db):
     # First create a household
-    household_response = client.post(
+    household_response = await admin_client.post(
         "/create_household",
         data={"household_name": "Test Household 2"}
     )
-    assert household_response.status_code == 200
+    assert household_response.status_code == 303
+    household = db.query(Household).filter(Household.name == "Test Household 2").one()
+    
+    user = User(name="Test Member", email="test-member@example.com", role=UserRole.MEMBER)
+    db.add(user)
+    db.commit()
     
     # Then add a member
-    response = client.post(
+    response = await admin_client.post(
         "/add_member",
         data={
-            "household_id": 1,
-            "member_name": "Test Member"
+            "household_id": household.id,
+            "user_id": user.id
         }
     )
+    assert response.status_code == 303
+    assert response.headers["location"] == "/manage_household"
+    
+    response = await admin_client.get(f"/get_household_members/{household.id}")
     assert response.status_code == 200
-    assert "Test Member" in response.text
+    assert "Test Member" in [member["name"] for member in response.json()]
 
-@pytest.mark.asyncio
-async def test_add_food():
-    response = client.post(
+async def test_add_food(admin_client, db, monkeypatch):
+    import main
+    from database import engine
+    
+    async def fake_nutrition(food_name, portion_size):
+        # The request's connection goes back to the pool before the AI call
+        assert engine.pool.checkedout() == checked_out
+        return {'calories': 95, 'protein': 0.5, 'carbohydrates': 25, 'fiber': 4, 'fat': 0.3, 'sugar': 19}
+    monkeypatch.setattr(main, "get_nutrition_info", fake_nutrition)
+    
+    household_response = await admin_client.post(
+        "/create_household",
+        data={"household_name": "Food Household"}
+    )
+    assert household_response.status_code == 303
+    household = db.query(Household).filter(Household.name == "Food Household").one()
+    admin = db.query(User).filter(User.role == UserRole.ADMIN).first()
+    checked_out = engine.pool.checkedout()
+    response = await admin_client.post(
         "/add_food",
         data={
-            "household_id": 1,
-            "user_id": 1,
+            "household_id": household.id,
+            "user_id": admin.id,
             "food_name": "apple",
             "portion_size": "1 medium"
         }
     )
+    assert response.status_code == 303
+    
+    response = await admin_client.get(response.headers["location"])
     assert response.status_code == 200
     assert "Entry added" in response.text
+    assert "apple" in response.text
+
+# Upper bounds on SQL statements per page, so a lazy load that turns into
+# one query per row shows up as a test failure
+async def test_dashboard_query_count(member_client, count_queries):
+    with count_queries() as queries:
+        response = await member_client.get("/")
+    assert response.status_code == 200
+    assert len(queries) <= 8
+
+async def test_view_logs_query_count(member_client, count_queries):
+    with count_queries() as queries:
+        response = await member_client.get("/view_logs")
+    assert response.status_code == 200
+    assert len(queries) <= 4
+
+async def test_household_members_query_count(member_client, member_household_ids, count_queries):
+    with count_queries() as queries:
+        response = await member_client.get(f"/get_household_members/{member_household_ids[0]}")
+    assert response.status_code == 200
+    assert len(queries) <= 4
+
+async def test_login_limits_failed_attempts_per_email(client, db):
+    from auth import hash_password
+    db.add(User(
+        name="Locked Out",
+        email="locked-out@example.com",
+        password_hash=hash_password("right-password"),
+        is_email_verified=True,
+        role=UserRole.MEMBER
+    ))
+    db.commit()
+
+    async def login(password, ip):
+        # A different client address each time, so only the per-email limit applies
+        return await client.post(
+            "/login",
+            data={"email": "locked-out@example.com", "password": password},
+            headers={"X-Forwarded-For": ip}
+        )
+
+    # Successful logins don't count towards the limit
+    for i in range(12):
+        assert (await login("right-password", f"10.0.0.{i}")).status_code == 303
+    client.cookies.clear()
+
+    for i in range(10):
+        response = await login("wrong", f"10.0.1.{i}")
+        assert response.status_code == 200
+        assert "Invalid email or password" in response.text
+
+    response = await login("right-password", "10.0.2.1")
+    assert response.status_code == 429
+    assert "Too many login attempts" in response.text
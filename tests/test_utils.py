@@ -0,0 +1,75 @@
+import datetime
+
+from utils import (
+    LogRow, calculate_daily_calories, format_timestamp, get_calorie_goal_progress,
+    index_logs_by_user_day, query_daily_calories
+)
+
+DAY = datetime.date(2024, 3, 10)
+MIDNIGHT = datetime.datetime(2024, 3, 10)
+
+
+def test_daily_calories_day_boundaries():
+    logs = [
+        LogRow(1, MIDNIGHT, 100.0),                                            # start of day: in
+        LogRow(1, MIDNIGHT + datetime.timedelta(hours=23, minutes=59), 50.0),  # end of day: in
+        LogRow(1, MIDNIGHT - datetime.timedelta(microseconds=1), 7.0),         # previous day: out
+        LogRow(1, MIDNIGHT + datetime.timedelta(days=1), 9.0),                 # next midnight: out
+        LogRow(2, MIDNIGHT, 400.0),                                            # other user: out
+    ]
+    assert calculate_daily_calories(logs, 1, today=DAY) == 150.0
+    assert calculate_daily_calories(logs, 3, today=DAY) == 0.0
+
+def test_daily_calories_today_override():
+    logs = [LogRow(1, MIDNIGHT, 100.0), LogRow(1, MIDNIGHT + datetime.timedelta(days=1), 30.0)]
+    assert calculate_daily_calories(logs, 1, today=DAY + datetime.timedelta(days=1)) == 30.0
+
+def test_daily_calories_defaults_to_today():
+    logs = [LogRow(1, datetime.datetime.now(), 80.0), LogRow(1, MIDNIGHT, 100.0)]
+    assert calculate_daily_calories(logs, 1) == 80.0
+
+def test_index_logs_by_user_day():
+    logs = [
+        LogRow(1, MIDNIGHT, 100.0),
+        LogRow(1, MIDNIGHT + datetime.timedelta(hours=12), 50.0),
+        LogRow(1, MIDNIGHT + datetime.timedelta(days=1), 9.0),
+        LogRow(2, MIDNIGHT, 400.0),
+    ]
+    index = index_logs_by_user_day(logs)
+    assert index == {
+        (1, DAY): 150.0,
+        (1, DAY + datetime.timedelta(days=1)): 9.0,
+        (2, DAY): 400.0,
+    }
+    assert index.get((3, DAY), 0.0) == 0.0
+
+def test_query_daily_calories(db):
+    from models import FoodLog, User
+    user = User(name="Calorie Counter", email="calorie-counter@example.com")
+    other = User(name="Someone Else", email="someone-else@example.com")
+    db.add_all([user, other])
+    db.flush()
+    db.add_all([
+        FoodLog(user_id=user.id, calorie_count=100.0, timestamp=MIDNIGHT),
+        FoodLog(user_id=user.id, calorie_count=50.0, timestamp=MIDNIGHT + datetime.timedelta(hours=20)),
+        FoodLog(user_id=user.id, calorie_count=7.0, timestamp=MIDNIGHT - datetime.timedelta(seconds=1)),
+        FoodLog(user_id=user.id, calorie_count=9.0, timestamp=MIDNIGHT + datetime.timedelta(days=1)),
+        FoodLog(user_id=other.id, calorie_count=400.0, timestamp=MIDNIGHT),
+    ])
+    db.commit()
+
+    assert query_daily_calories(db, user.id, today=DAY) == 150.0
+    assert query_daily_calories(db, user.id, today=DAY + datetime.timedelta(days=1)) == 9.0
+    assert query_daily_calories(db, user.id, today=DAY - datetime.timedelta(days=5)) == 0.0
+
+def test_calorie_goal_progress_clamps():
+    assert get_calorie_goal_progress(500, 2000) == 25.0
+    assert get_calorie_goal_progress(3000, 2000) == 100.0
+    assert get_calorie_goal_progress(-50, 2000) == 0.0
+    assert get_calorie_goal_progress(500, 0) == 0.0
+    assert get_calorie_goal_progress(500, -100) == 0.0
+
+def test_format_timestamp():
+    assert format_timestamp(datetime.datetime(2024, 3, 10, 7, 5, 3, 999)) == "2024-03-10 07:05:03"
+    aware = datetime.datetime(2024, 3, 10, 7, 5, 3, tzinfo=datetime.timezone.utc)
+    assert format_timestamp(aware) == "2024-03-10 07:05:03"
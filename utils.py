@@ -2,32 +2,102 @@
 Utility functions for the Philosophers Fridge application.
 """
 import datetime
-from typing import Dict, List, Any
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import FoodLog
 
+class LogRow(NamedTuple):
+    """The food log fields the calorie helpers read.
+    
+    Rows from select(FoodLog.user_id, FoodLog.timestamp, FoodLog.calorie_count)
+    have the same attributes and can be passed as they are.
+    """
+    user_id: int
+    timestamp: datetime.datetime
+    calorie_count: float
+
+@lru_cache(maxsize=4096)
 def format_timestamp(timestamp: datetime.datetime) -> str:
     """Format a datetime object into a readable string."""
+    # For naive datetimes isoformat gives the same text as strftime and is
+    # several times faster; aware ones would gain a UTC offset, so keep strftime
+    if timestamp.tzinfo is None:
+        return timestamp.isoformat(' ', 'seconds')
     return timestamp.strftime("%Y-%m-%d %H:%M:%S")
 
-def calculate_daily_calories(logs: List[Dict[str, Any]], user_id: int) -> float:
+def _day_bounds(day: datetime.date) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Return the start of a day and the start of the next one."""
+    start = datetime.datetime.combine(day, datetime.time.min)
+    return start, start + datetime.timedelta(days=1)
+
+def calculate_daily_calories(logs: Sequence[LogRow], user_id: int,
+                             today: Optional[datetime.date] = None) -> float:
     """
     Calculate the total calories consumed by a user in the current day.
     
     Args:
-        logs: List of food log entries
+        logs: Food log rows
         user_id: ID of the user
+        today: Day to total; defaults to today. Pass it in when calling
+            this for several users so the date is only looked up once.
         
     Returns:
         Total calories consumed today
     """
-    today = datetime.datetime.now().date()
-    total_calories = 0.0
+    # Compare against the day's bounds rather than calling .date() on every row,
+    # and let sum() drive the loop
+    start, end = _day_bounds(today or datetime.date.today())
+    
+    return float(sum(
+        log.calorie_count for log in logs
+        if log.user_id == user_id and start <= log.timestamp < end
+    ))
+
+def index_logs_by_user_day(logs: Sequence[LogRow]) -> Dict[Tuple[int, datetime.date], float]:
+    """
+    Total calories per (user, day) in one pass over the logs.
+    
+    Use this instead of calling calculate_daily_calories once per user: build
+    the index once, then look each user up with index.get((user_id, day), 0.0).
     
+    Args:
+        logs: Food log rows
+        
+    Returns:
+        Mapping of (user_id, date) to total calories
+    """
+    totals = defaultdict(float)
     for log in logs:
-        if (log['user_id'] == user_id and 
-            log['timestamp'].date() == today):
-            total_calories += log['calorie_count']
-            
-    return total_calories
+        totals[(log.user_id, log.timestamp.date())] += log.calorie_count
+    return dict(totals)
+
+def query_daily_calories(db: Session, user_id: int,
+                         today: Optional[datetime.date] = None) -> float:
+    """
+    Calculate the total calories consumed by a user in the current day in SQL.
+    
+    Use this instead of calculate_daily_calories when the logs would otherwise
+    be loaded from the database only to be summed.
+    
+    Args:
+        db: Database session
+        user_id: ID of the user
+        today: Day to total; defaults to today
+        
+    Returns:
+        Total calories consumed today
+    """
+    # A range on the raw column (not date(timestamp)) so ix_foodlog_user_ts applies
+    start, end = _day_bounds(today or datetime.date.today())
+    
+    return float(db.query(func.coalesce(func.sum(FoodLog.calorie_count), 0.0)).filter(
+        FoodLog.user_id == user_id,
+        FoodLog.timestamp >= start,
+        FoodLog.timestamp < end
+    ).scalar())
 
 def get_calorie_goal_progress(current_calories: float, goal_calories: float) -> float:
     """
@@ -40,8 +110,5 @@ def get_calorie_goal_progress(current_calories: float, goal_calories: float) ->
     Returns:
         Percentage of goal reached (0-100)
     """
-    if goal_calories <= 0:
-        return 0
-    
-    progress = (current_calories / goal_calories) * 100
-    return min(progress, 100)  # Cap at 100%
+    # Single expression, capped at 100%; no progress without a goal
+    return min(100.0, max(0.0, current_calories * 100.0 / goal_calories)) if goal_calories > 0 else 0.0